@@ -38,8 +38,9 @@ class CourseAdmin(CoursesBaseAdmin):
     search_fields = ('name', 'nen_kumi', 'year')
 
     def image_preview(self, obj):
+        thumbnails = obj.thumbnails
         return format_html('<img src="{}" width="{}" height={} />',
-            obj.image_path.url,
+            thumbnails.url(200) if thumbnails else obj.image_path.url,
             200,
             200,
         )
@@ -0,0 +1,62 @@
+"""Answer keys for checking student answers.
+
+Checking an answer only needs a handful of columns from Problem, and the same
+randomized variables are checked again and again. The answers are kept in a
+per-process LRU cache keyed by (problem pk, last_modified, variables), so a
+repeated check is a dict lookup instead of evaluating the answer expression.
+Problem.save forgets the answers for that problem; last_modified in the key
+covers saves made by other processes.
+"""
+from collections import OrderedDict
+import threading
+
+from courses.metrics import CACHE_REQUESTS
+
+
+ANSWER_KEY_FIELDS = (
+    'id',
+    'answer',
+    'calculated_answer',
+    'last_modified',
+    'variables_spec',
+    'variables_with_values',
+    'worksheet',
+)
+MAX_CACHED_PROBLEMS = 4096
+MAX_ANSWERS_PER_PROBLEM = 512
+
+_answer_keys = OrderedDict() # pk -> (last_modified, { variables: answer })
+_lock = threading.Lock()
+
+
+def answer_key(problem) -> float:
+    """The rounded answer for the variables the problem is using."""
+    if not problem.use_vars:
+        return problem.calculated_answer
+    elif problem.pk is None:
+        return problem.calculate_answer()
+    variables = tuple(sorted(problem.use_vars.items()))
+    with _lock:
+        last_modified, answers = _answer_keys.get(problem.pk, (None, None))
+        if last_modified == problem.last_modified and variables in answers:
+            _answer_keys.move_to_end(problem.pk)
+            CACHE_REQUESTS.inc(cache='answer_key', result='hit')
+            return answers[variables]
+    CACHE_REQUESTS.inc(cache='answer_key', result='miss')
+    answer = problem.calculate_answer()
+    with _lock:
+        last_modified, answers = _answer_keys.get(problem.pk, (None, None))
+        if (last_modified != problem.last_modified
+                or len(answers) >= MAX_ANSWERS_PER_PROBLEM):
+            answers = dict()
+            _answer_keys[problem.pk] = (problem.last_modified, answers)
+        answers[variables] = answer
+        _answer_keys.move_to_end(problem.pk)
+        while len(_answer_keys) > MAX_CACHED_PROBLEMS:
+            _answer_keys.popitem(last=False)
+    return answer
+
+def forget_answer_keys(pk) -> None:
+    """Remove the cached answers for a problem."""
+    with _lock:
+        _answer_keys.pop(pk, None)
@@ -1,6 +1,26 @@
 from django.apps import AppConfig
+from django.core.signals import request_started
+from django.db.models.signals import m2m_changed, post_delete, post_save
 
 
 class CoursesConfig(AppConfig):
     description = 'All of the courses that I teach.'
     name = 'courses'
+
+    def ready(self):
+        from courses.models import Course, Lesson, Resource, Syllabus, Worksheet
+        from courses.pagecache import forget_pages
+        from courses.routing import forget_routes
+        from courses.versions import forget_version
+
+        # The version of the content is read again for every request.
+        request_started.connect(forget_version)
+        for model in (Course, Worksheet):
+            post_save.connect(forget_routes, sender=model)
+            post_delete.connect(forget_routes, sender=model)
+        m2m_changed.connect(forget_routes, sender=Worksheet.course.through)
+        for model in (Course, Syllabus, Lesson, Resource, Worksheet):
+            post_save.connect(forget_pages, sender=model)
+            post_delete.connect(forget_pages, sender=model)
+        m2m_changed.connect(forget_pages, sender=Resource.courses.through)
+        m2m_changed.connect(forget_pages, sender=Worksheet.course.through)
@@ -0,0 +1,141 @@
+"""ETag and Last-Modified validators for conditional GET requests.
+
+Each validator reads the max last_modified (and the number of rows, so that
+deletions are noticed) of everything a page shows with a single aggregate
+query. The course and worksheets come from courses.routing, and the version
+of the content (see courses.versions) is part of every ETag. Both are read
+from the database, so every process gives the same validators. The sitemap
+only needs the version. When the browser's copy is still valid the response
+is 304 Not Modified and the view is not run at all.
+
+The pages depend on more than the rows: the links to the current term change
+with the date, and the edit links and csrf tokens depend on who is visiting.
+The date is included in both validators, the session and csrf cookies in the
+ETag. Randomized and shuffled worksheets are never answered with a 304.
+"""
+from collections import namedtuple
+import hashlib
+import json
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+from courses.models import Problem, Resource, Syllabus, Worksheet
+from courses.routing import course_worksheets
+from courses.versions import content_version
+from courses.viewaids import ( course_from_kwargs, get_randomization_seed,
+    worksheet_from_kwargs )
+
+
+Validator = namedtuple('Validator', ['etag', 'last_modified'])
+
+
+def make_validator(request, parts: list, timestamps: list) -> Validator:
+    """A weak ETag for parts, and the latest of the timestamps."""
+    start_of_day = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    parts = [
+        *parts,
+        start_of_day,
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME),
+    ]
+    content = json.dumps(parts, sort_keys=True, default=str)
+    return Validator(
+        etag='W/"{}"'.format(hashlib.sha1(content.encode()).hexdigest()),
+        last_modified=max([ timestamp for timestamp in timestamps if timestamp ] + [start_of_day]),
+    )
+
+def conditional_page(validator_func):
+    """Like django.views.decorators.http.condition, with a single validator.
+
+    validator_func(request, *args, **kwargs) returns a Validator, or None if
+    the request should not be answered with a 304. It is called once per
+    request.
+    """
+    def validator(request, *args, **kwargs):
+        if not hasattr(request, '_courses_validator'):
+            request._courses_validator = validator_func(request, *args, **kwargs)
+        return request._courses_validator
+
+    def etag(request, *args, **kwargs):
+        return getattr(validator(request, *args, **kwargs), 'etag', None)
+
+    def last_modified(request, *args, **kwargs):
+        return getattr(validator(request, *args, **kwargs), 'last_modified', None)
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
+
+def syllabus_validator(request, *args, **kwargs) -> Validator:
+    course = course_from_kwargs(kwargs)
+    if course is None:
+        return None
+    rows = Syllabus.objects.filter(course=course).aggregate(
+        syllabus=Max('last_modified'),
+        lessons=Max('lesson__last_modified'),
+        lesson_count=Count('lesson'),
+        syllabus_count=Count('pk', distinct=True),
+    )
+    return make_validator(
+        request,
+        ['syllabus', kwargs, content_version().token, rows['lesson_count'],
+            rows['syllabus_count']],
+        [course.last_modified, rows['syllabus'], rows['lessons']],
+    )
+
+def resources_validator(request, *args, **kwargs) -> Validator:
+    course = course_from_kwargs(kwargs)
+    if course is None:
+        return None
+    rows = Resource.objects.filter(courses=course).aggregate(
+        resources=Max('last_modified'),
+        resource_count=Count('pk'),
+    )
+    return make_validator(
+        request,
+        ['resources', kwargs, content_version().token, rows['resource_count']],
+        [course.last_modified, rows['resources']],
+    )
+
+def worksheets_validator(request, *args, **kwargs) -> Validator:
+    """Only worksheets with the default variables, in the default order."""
+    if kwargs['order'] == 'random':
+        return None
+    course = course_from_kwargs(kwargs)
+    if course is None:
+        return None
+    worksheets = course_worksheets(course)
+    try:
+        worksheet = worksheet_from_kwargs(kwargs, course)
+    except Worksheet.DoesNotExist:
+        return None
+    parts = [
+        'worksheets',
+        kwargs,
+        content_version().token,
+        [ (ws.pk, ws.title) for ws in worksheets ],
+    ]
+    timestamps = [ course.last_modified ]
+    timestamps.extend( ws.last_modified for ws in worksheets )
+    if worksheet:
+        if get_randomization_seed(request.session, worksheet.pk) is not None:
+            return None
+        rows = Problem.objects.filter(worksheet=worksheet).aggregate(
+            problems=Max('last_modified'),
+            problem_count=Count('pk'),
+        )
+        parts.extend([ rows['problem_count'], worksheet.solutions_released ])
+        timestamps.append(rows['problems'])
+        if worksheet.solutions_released:
+            timestamps.append(worksheet.solution_release_datetime)
+    return make_validator(request, parts, timestamps)
+
+def sitemap_validator(request, *args, **kwargs) -> Validator:
+    """From the version of the content, which changes with the sitemap."""
+    version = content_version()
+    return make_validator(
+        request,
+        ['sitemap', request.path, request.GET.get('p'), version.token],
+        [version.last_modified],
+    )
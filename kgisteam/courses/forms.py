@@ -1,4 +1,3 @@
-from string import Template
 import re
 
 from django import forms
@@ -6,8 +5,9 @@ from django.core.exceptions import ValidationError
 from django.utils import timezone
 
 from courses.models import Course, Problem
-from courses.validators import validate_math_expression
-from courses.maths import evaluate_answer, sn_round
+from courses.maths import ( USER_ANSWER_MAX_LENGTH, ExpressionError,
+    compile_answer, evaluate_user_answer )
+from courses.numformat import sn_round
 
 
 def is_url_safe(string):
@@ -86,26 +86,25 @@ class ProblemInlineForm(forms.ModelForm):
     def clean_answer(self):
         vars_with_vals = self.cleaned_data['variables_with_values']
         answer = self.cleaned_data['answer']
-        var_names_brackets = re.compile(r'(?<=\$)\w+')
-        var_names_no_brackets = re.compile(r'(?<=\$){([^}]+)}')
+        try:
+            compiled_answer = compile_answer(answer)
+        except ExpressionError:
+            raise ValidationError(
+                'Answer is not a valid mathematical expression',
+                code='invalid',
+            )
         # Check that all variables are defined.
         vars = set(re.findall(r'\w+(?=\[)', vars_with_vals))
-        answer_vars = set( 
-            re.findall(var_names_brackets, answer) +     # names without brackets 
-            re.findall(var_names_no_brackets, answer) # names with brackets
-        )
-        if not vars.issuperset(answer_vars):
+        if not vars.issuperset(compiled_answer.variables):
             raise ValidationError(
                 'Undefined variable(s): %(value)s',
                 code='invalid',
-                params={'value': sorted(answer_vars)},
+                params={'value': sorted(compiled_answer.variables)},
             )
         # Set all variables to 1 and check that answer if a valid math expression.
-        sub_vars = { '{}'.format(var): 1 for var in answer_vars }
-        template = Template(answer)
-        expression = template.substitute(**sub_vars)
+        sub_vars = { var: 1 for var in compiled_answer.variables }
         try:
-            eval(expression)
+            compiled_answer(sub_vars)
         except:
             raise ValidationError(
                 'Answer is not a valid mathematical expression',
@@ -122,19 +121,37 @@ class WorksheetAdminForm(forms.ModelForm):
             return title
 
 
+class MathExpressionField(forms.CharField):
+    """A field that evaluates an untrusted mathematical expression.
+
+    The expression is evaluated exactly once, by to_python, and the number is
+    what ends up in cleaned_data.
+    """
+    default_error_messages = {
+        'invalid': 'Not a number or mathematical expression.',
+    }
+
+    def to_python(self, value):
+        value = super().to_python(value)
+        if value in self.empty_values:
+            return value
+        try:
+            return evaluate_user_answer(value)
+        except ExpressionError:
+            raise ValidationError(self.error_messages['invalid'], code='invalid')
+
+
 class WorksheetProblemForm(forms.Form):
-    user_answer = forms.CharField(
+    user_answer = MathExpressionField(
         label='',
-        validators=[validate_math_expression],
         widget=forms.TextInput(attrs={
             'autocomplete': 'off',
+            'maxlength': USER_ANSWER_MAX_LENGTH,
             }
         )
     )
 
     def clean_user_answer(self) -> float:
         """https://docs.djangoproject.com/en/2.2/ref/forms/validation/"""
-        user_answer = evaluate_answer(self.cleaned_data['user_answer'])
-        user_answer_rounded = sn_round(user_answer)
+        user_answer_rounded = sn_round(self.cleaned_data['user_answer'])
         return user_answer_rounded
-
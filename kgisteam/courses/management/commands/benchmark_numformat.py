@@ -0,0 +1,87 @@
+"""Compare courses.numformat with the original eval() based rounding.
+
+Usage: manage.py benchmark_numformat [--size 200000] [--seed 0]
+"""
+import timeit
+
+import numpy as np
+
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.numformat import ( sn_round, sn_round_array, sn_round_str,
+    sn_round_str_array )
+
+
+def legacy_sn_round(number: float) -> float:
+    """The original implementation of sn_round, kept as the reference."""
+    scientific_notation_str = '{:.2e}'.format(number)
+    num_str, order_str = scientific_notation_str.split('e')
+    rounded_num = round(eval(num_str), 3)
+    num_str = str(rounded_num)
+    scientific_notation_str = 'e'.join((num_str, order_str))
+    return eval('{:.2e}'.format(number))
+
+def legacy_sn_round_str(number: float) -> str:
+    """The original implementation of sn_round_str, kept as the reference."""
+    if number < 0.00001 or number > 100000:
+        rounded = '{:.2e}'.format(number)
+        value, order = rounded.split('e')
+        if order.startswith('+'):
+            order = order[1:].lstrip('0')
+        order = '{' + order + '}'
+        return '{value} \\times 10^{order}'.format(value=value, order=order)
+    else:
+        return str(number)
+
+def corpus(size: int, seed: int) -> list:
+    """Random numbers shaped like the variables and answers in problems."""
+    rng = np.random.default_rng(seed)
+    part = size // 4
+    numbers = np.concatenate([
+        rng.uniform(-1000, 1000, part),
+        10 ** rng.uniform(-30, 30, part),
+        rng.integers(-10**6, 10**6, part).astype(float),
+        # Numbers that are exactly on a rounding boundary.
+        rng.integers(1000, 10000, size - 3 * part) * 0.5,
+    ])
+    return numbers.tolist()
+
+
+class Command(BaseCommand):
+    help = 'Check that courses.numformat matches the original rounding and time both.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=200000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        numbers = corpus(options['size'], options['seed'])
+        checks = [
+            ('sn_round', legacy_sn_round, sn_round,
+                lambda: sn_round_array(numbers).tolist()),
+            ('sn_round_str', legacy_sn_round_str, sn_round_str,
+                lambda: sn_round_str_array(numbers)),
+        ]
+        for name, legacy, current, array in checks:
+            expected = [ legacy(number) for number in numbers ]
+            for label, result in [
+                    (name, [ current(number) for number in numbers ]),
+                    ('{}_array'.format(name), array())]:
+                mismatches = [ number for number, a, b
+                    in zip(numbers, expected, result) if a != b ]
+                if mismatches:
+                    raise CommandError('{} differs for {} numbers, e.g. {!r}'.format(
+                        label, len(mismatches), mismatches[0]
+                    ))
+            timings = [
+                ('legacy', timeit.timeit(
+                    lambda: [ legacy(number) for number in numbers ], number=1)),
+                ('scalar', timeit.timeit(
+                    lambda: [ current(number) for number in numbers ], number=1)),
+                ('array', timeit.timeit(array, number=1)),
+            ]
+            self.stdout.write('{}: identical for {} numbers'.format(name, len(numbers)))
+            for label, seconds in timings:
+                self.stdout.write('    {:<7}{:>10.1f} ns/number'.format(
+                    label, seconds / len(numbers) * 1e9
+                ))
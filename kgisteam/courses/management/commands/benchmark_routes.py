@@ -0,0 +1,208 @@
+"""Time every route in courses/urls.py against the data in the database.
+
+Usage: manage.py benchmark_routes [--requests 50] [--seed 0] [--host HOST]
+    [--output FILE] [--compare FILE]
+
+Fill a copy of the database with seed_synthetic first, the benchmark writes
+sessions and worksheet progress. Each route is requested once after the
+routing index and the page cache were cleared (the cold request), then
+--requests times. The latency percentiles, the number of queries and the
+peak memory of a request (measured in a separate pass with tracemalloc,
+which slows the requests down) are printed and written to a JSON file, by
+default in COURSES_BENCHMARK_DIR (see the settings), and --compare prints
+the change from an earlier file.
+"""
+import json
+import os
+import platform
+import random
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from courses.models import Course, Lesson, Problem, Resource, Worksheet
+from courses.pagecache import forget_pages
+from courses.routing import forget_routes
+
+
+def percentile(values: list, fraction: float) -> float:
+    """The nearest rank percentile of values."""
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(fraction * len(values)) - 1))]
+
+def pick_targets(rng: random.Random) -> tuple:
+    """A course, one of its worksheets and the worksheet's problems."""
+    worksheets = list(Worksheet.objects
+        .annotate(problem_count=Count('problem'))
+        .filter(problem_count__gt=0, course__isnull=False)
+        .values_list('pk', 'course')
+        .order_by('pk'))
+    if not worksheets:
+        raise CommandError('There are no worksheets with problems, run seed_synthetic first.')
+    worksheet_pk, course_pk = rng.choice(worksheets)
+    course = Course.objects.get(pk=course_pk)
+    worksheet = Worksheet.objects.get(pk=worksheet_pk)
+    problems = list(Problem.objects.filter(worksheet=worksheet).order_by('pk'))
+    return course, worksheet, problems
+
+def routes(course: Course, worksheet: Worksheet, problems: list) -> list:
+    """(name, method, path, data, content_type) for every route."""
+    course_kwargs = {
+        'year': course.year,
+        'school': course.school,
+        'name': course.name,
+        'nen_kumi': course.nen_kumi,
+    }
+    worksheet_kwargs = dict(course_kwargs, title=worksheet.title, order='ordered')
+    problem = problems[0]
+    return [
+        ('home', 'get', reverse('courses:home'), None, None),
+        ('syllabus', 'get', reverse('courses:syllabus',
+            kwargs=dict(course_kwargs, term=course.term_now)), None, None),
+        ('resources', 'get', reverse('courses:resources', kwargs=course_kwargs), None, None),
+        ('worksheets', 'get', reverse('courses:worksheets', kwargs=worksheet_kwargs), None, None),
+        ('worksheets-random', 'get', reverse('courses:worksheets',
+            kwargs=dict(worksheet_kwargs, order='random')), None, None),
+        ('worksheets-check', 'post', reverse('courses:worksheets-check',
+            kwargs={'problem_id': problem.pk}),
+            {'user_answer': str(problem.calculated_answer)}, None),
+        ('worksheets-check-all', 'post', reverse('courses:worksheets-check-all',
+            kwargs={'worksheet_id': worksheet.pk}),
+            json.dumps([ [p.pk, str(p.calculated_answer)] for p in problems ]),
+            'application/json'),
+        ('worksheets-check-results', 'get', '{}?worksheet={}'.format(
+            reverse('courses:worksheets-check-results'), worksheet.pk), None, None),
+        ('worksheets-randomize', 'get', reverse('courses:worksheets-randomize',
+            kwargs=worksheet_kwargs), None, None),
+        ('worksheets-reset', 'get', reverse('courses:worksheets-reset',
+            kwargs=worksheet_kwargs), None, None),
+        ('worksheets-reset-all', 'get', reverse('courses:worksheets-reset-all',
+            kwargs=worksheet_kwargs), None, None),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Time every route in courses/urls.py and write the results to a JSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50,
+            help='Requests per route, after the cold request.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--host',
+            help='The default is the first of ALLOWED_HOSTS, or localhost.')
+        parser.add_argument('--output',
+            help='The default is benchmark-<UTC time>.json in COURSES_BENCHMARK_DIR.')
+        parser.add_argument('--compare', help='An earlier output file.')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests must be at least 1.')
+        course, worksheet, problems = pick_targets(random.Random(options['seed']))
+        host = options['host'] or next(iter(settings.ALLOWED_HOSTS), 'localhost')
+        client = Client(HTTP_HOST=host)
+        # The requests of the benchmark are not traffic for courses.metrics.
+        with override_settings(COURSES_METRICS_DIR=None):
+            results = [
+                self.benchmark(client, route, options['requests'])
+                for route in routes(course, worksheet, problems)
+            ]
+        report = {
+            'created': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'dataset': {
+                'courses': Course.objects.count(),
+                'worksheets': Worksheet.objects.count(),
+                'problems': Problem.objects.count(),
+                'lessons': Lesson.objects.count(),
+                'resources': Resource.objects.count(),
+            },
+            'target': {
+                'course': str(course),
+                'worksheet': worksheet.title,
+                'problems': len(problems),
+            },
+            'requests': options['requests'],
+            'routes': results,
+        }
+        output = options['output']
+        if not output:
+            directory = getattr(settings, 'COURSES_BENCHMARK_DIR',
+                os.path.join(settings.BASE_DIR, 'benchmarks'))
+            os.makedirs(directory, exist_ok=True)
+            output = os.path.join(directory, 'benchmark-{}.json'.format(
+                timezone.now().strftime('%Y%m%dT%H%M%SZ')))
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        previous = dict()
+        if options['compare']:
+            with open(options['compare']) as f:
+                previous = { route['name']: route for route in json.load(f)['routes'] }
+        self.write_table(results, previous)
+        self.stdout.write('Wrote {}'.format(output))
+
+    def request(self, client: Client, route: tuple):
+        name, method, path, data, content_type = route
+        kwargs = { 'content_type': content_type } if content_type else dict()
+        return getattr(client, method)(path, data, secure=True, **kwargs)
+
+    def benchmark(self, client: Client, route: tuple, count: int) -> dict:
+        forget_routes()
+        forget_pages()
+        start = time.perf_counter()
+        response = self.request(client, route)
+        cold_ms = (time.perf_counter() - start) * 1000
+        if response.status_code >= 400:
+            raise CommandError('{} {} returned {}'.format(
+                route[1].upper(), route[2], response.status_code))
+        timings = list()
+        queries = list()
+        for i in range(0, count):
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                self.request(client, route)
+                timings.append((time.perf_counter() - start) * 1000)
+            queries.append(len(context.captured_queries))
+        tracemalloc.start()
+        try:
+            self.request(client, route)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return {
+            'name': route[0],
+            'method': route[1].upper(),
+            'path': route[2],
+            'status': response.status_code,
+            'cold_ms': round(cold_ms, 3),
+            'p50_ms': round(percentile(timings, 0.5), 3),
+            'p90_ms': round(percentile(timings, 0.9), 3),
+            'p99_ms': round(percentile(timings, 0.99), 3),
+            'mean_ms': round(sum(timings) / len(timings), 3),
+            'max_ms': round(max(timings), 3),
+            'queries': max(queries),
+            'peak_kib': round(peak / 1024, 1),
+        }
+
+    def write_table(self, results: list, previous: dict) -> None:
+        self.stdout.write('{:<26}{:>9}{:>9}{:>9}{:>9}{:>8}{:>10}'.format(
+            'route', 'cold ms', 'p50 ms', 'p90 ms', 'p99 ms', 'queries', 'peak KiB'))
+        for result in results:
+            line = '{name:<26}{cold_ms:>9.1f}{p50_ms:>9.1f}{p90_ms:>9.1f}{p99_ms:>9.1f}{queries:>8}{peak_kib:>10.1f}'.format(**result)
+            before = previous.get(result['name'])
+            if before:
+                line += '  p50 {:+.0%}, {:+} queries'.format(
+                    result['p50_ms'] / before['p50_ms'] - 1 if before['p50_ms'] else 0,
+                    result['queries'] - before['queries'],
+                )
+            self.stdout.write(line)
@@ -0,0 +1,18 @@
+"""Delete worksheet progress that belongs to sessions that no longer exist.
+
+Run it after Django's clearsessions, e.g. from the same cron job.
+"""
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+
+from courses.models import WorksheetProgress
+
+
+class Command(BaseCommand):
+    help = 'Delete worksheet progress for expired or deleted sessions.'
+
+    def handle(self, *args, **options):
+        deleted, _ = WorksheetProgress.objects.exclude(
+            session_key__in=Session.objects.values('session_key'),
+        ).delete()
+        self.stdout.write('Deleted {} worksheet progress rows.'.format(deleted))
@@ -0,0 +1,236 @@
+"""Simulate a class of students working through a worksheet at once.
+
+Usage: manage.py loadtest_classroom [--url http://127.0.0.1:8000]
+    [--students 40] [--rounds 1] [--think 0] [--worksheet PK] [--seed 0]
+    [--timeout 30] [--output FILE]
+
+Start the server first, with the same settings and database, e.g.
+``manage.py runserver --noreload`` or gunicorn with the number of workers
+to size. Every student is a thread with its own cookies. They wait for each
+other, then all open the worksheet, randomize it, check the answers one by
+one, read the results and reset the worksheet, like a class at the start of
+a lesson. The answers are the correct ones for the variables the student
+got, which are read from the student's session in the database. The throughput, the latency percentiles and the errors of every
+step and the growth of the session and progress tables are printed, and
+written to --output as JSON.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from importlib import import_module
+import copy
+import json
+import random
+import threading
+import time
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from courses.management.commands.benchmark_routes import percentile, pick_targets
+from courses.models import Course, Problem, Worksheet, WorksheetProgress
+from courses.viewaids import get_randomization_seed
+
+
+STEPS = ('worksheets', 'randomize', 'check', 'check-results', 'reset')
+
+
+class Student:
+    """One browser, the requests it made are in timings."""
+
+    def __init__(self, base_url: str, timeout: float):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies))
+        self.timings = list()
+        self.correct = 0
+
+    def cookie(self, name: str) -> str:
+        for cookie in self.cookies:
+            if cookie.name == name:
+                return cookie.value
+        return ''
+
+    def request(self, step: str, path: str, data: dict = None) -> bytes:
+        """Request path (redirects are followed) and record (step, ms, status).
+
+        Returns the body of the response, or None if there is no response.
+        """
+        request = Request(self.base_url + path)
+        if data is not None:
+            request.data = urlencode(data).encode()
+            request.add_header('X-CSRFToken', self.cookie(settings.CSRF_COOKIE_NAME))
+            request.add_header('Referer', self.base_url + path)
+        start = time.perf_counter()
+        body = None
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                body = response.read()
+                status = response.status
+        except HTTPError as error:
+            status = error.code
+        except (URLError, OSError):
+            status = 0
+        self.timings.append((step, (time.perf_counter() - start) * 1000, status))
+        return body
+
+
+class Command(BaseCommand):
+    help = 'Simulate a class of students working through a worksheet at once.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000',
+            help='The server to test.')
+        parser.add_argument('--students', type=int, default=40)
+        parser.add_argument('--rounds', type=int, default=1,
+            help='How many times every student works through the worksheet.')
+        parser.add_argument('--think', type=float, default=0,
+            help='The longest pause between two requests of a student, in seconds.')
+        parser.add_argument('--worksheet', type=int,
+            help='The default is a worksheet picked with --seed.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+
+    def handle(self, *args, **options):
+        if options['students'] < 1 or options['rounds'] < 1:
+            raise CommandError('--students and --rounds must be at least 1.')
+        if options['worksheet']:
+            worksheet = Worksheet.objects.get(pk=options['worksheet'])
+            course = worksheet.course.first()
+            if course is None:
+                raise CommandError('Worksheet {} is not in a course.'.format(worksheet.pk))
+            problems = list(Problem.objects.filter(worksheet=worksheet).order_by('pk'))
+        else:
+            course, worksheet, problems = pick_targets(random.Random(options['seed']))
+        paths = self.paths(course, worksheet)
+        tables = lambda: {
+            'sessions': Session.objects.count(),
+            'progress': WorksheetProgress.objects.count(),
+        }
+        before = tables()
+        students = [
+            Student(options['url'], options['timeout'])
+            for i in range(0, options['students'])
+        ]
+        start_together = threading.Barrier(len(students))
+
+        def work(i: int) -> None:
+            rng = random.Random('{}-{}'.format(options['seed'], i))
+            student = students[i]
+            think = lambda: time.sleep(rng.uniform(0, options['think']))
+            start_together.wait()
+            for round_ in range(0, options['rounds']):
+                student.request('worksheets', paths['worksheets'])
+                think()
+                student.request('randomize', paths['randomize'])
+                answers = self.answers(student, worksheet, problems)
+                for problem in problems:
+                    think()
+                    body = student.request('check',
+                        reverse('courses:worksheets-check', kwargs={'problem_id': problem.pk}),
+                        {'user_answer': answers[problem.pk]},
+                    )
+                    if body and json.loads(body).get('result') == 'correct':
+                        student.correct += 1
+                student.request('check-results', paths['check-results'])
+                think()
+                student.request('reset', paths['reset'])
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(students)) as executor:
+            list(executor.map(work, range(0, len(students))))
+        seconds = time.perf_counter() - start
+        after = tables()
+        timings = [ timing for student in students for timing in student.timings ]
+        report = {
+            'url': options['url'],
+            'course': str(course),
+            'worksheet': worksheet.title,
+            'problems': len(problems),
+            'students': options['students'],
+            'rounds': options['rounds'],
+            'think_s': options['think'],
+            'seconds': round(seconds, 3),
+            'requests': len(timings),
+            'requests_per_s': round(len(timings) / seconds, 1),
+            'errors': sum( 1 for step, ms, status in timings if not 200 <= status < 400 ),
+            'correct_answers': sum( student.correct for student in students ),
+            'steps': [ self.summary(step, timings) for step in STEPS ],
+            'tables_before': before,
+            'tables_after': after,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+        self.write_report(report)
+
+    def answers(self, student: Student, worksheet: Worksheet, problems: list) -> dict:
+        """{ problem pk: the correct answer } for the student's randomized worksheet."""
+        session_key = student.cookie(settings.SESSION_COOKIE_NAME)
+        seed = None
+        if session_key:
+            session = import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+            seed = get_randomization_seed(session, worksheet.pk)
+        answers = dict()
+        for problem in problems:
+            if seed is not None and problem.variables.has_variables:
+                # A copy, the problems are shared by the students.
+                problem = copy.copy(problem)
+                problem.use_variables(problem.variables_randomized(seed))
+            answers[problem.pk] = str(problem.calculate_answer())
+        return answers
+
+    def paths(self, course: Course, worksheet: Worksheet) -> dict:
+        kwargs = {
+            'year': course.year,
+            'school': course.school,
+            'name': course.name,
+            'nen_kumi': course.nen_kumi,
+            'title': worksheet.title,
+            'order': 'ordered',
+        }
+        return {
+            'worksheets': reverse('courses:worksheets', kwargs=kwargs),
+            'randomize': reverse('courses:worksheets-randomize', kwargs=kwargs),
+            'check-results': '{}?worksheet={}'.format(
+                reverse('courses:worksheets-check-results'), worksheet.pk),
+            'reset': reverse('courses:worksheets-reset', kwargs=kwargs),
+        }
+
+    def summary(self, step: str, timings: list) -> dict:
+        times = [ ms for name, ms, status in timings if name == step ]
+        errors = [ status for name, ms, status in timings
+            if name == step and not 200 <= status < 400 ]
+        if not times:
+            return { 'step': step, 'requests': 0 }
+        return {
+            'step': step,
+            'requests': len(times),
+            'error_rate': round(len(errors) / len(times), 4),
+            'statuses': sorted(set(errors)),
+            'p50_ms': round(percentile(times, 0.5), 1),
+            'p90_ms': round(percentile(times, 0.9), 1),
+            'p99_ms': round(percentile(times, 0.99), 1),
+            'max_ms': round(max(times), 1),
+        }
+
+    def write_report(self, report: dict) -> None:
+        self.stdout.write('{students} students x {rounds} rounds, {problems} problems: '
+            '{requests} requests in {seconds:.1f} s, {requests_per_s} requests/s, '
+            '{errors} errors, {correct_answers} correct answers'.format(**report))
+        self.stdout.write('{:<15}{:>9}{:>8}{:>9}{:>9}{:>9}{:>9}'.format(
+            'step', 'requests', 'errors', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms'))
+        for step in report['steps']:
+            if not step['requests']:
+                continue
+            self.stdout.write('{step:<15}{requests:>9}{error_rate:>8.1%}{p50_ms:>9.1f}'
+                '{p90_ms:>9.1f}{p99_ms:>9.1f}{max_ms:>9.1f}'.format(**step))
+        for table in ('sessions', 'progress'):
+            self.stdout.write('{} rows: {} -> {}'.format(
+                table, report['tables_before'][table], report['tables_after'][table]))
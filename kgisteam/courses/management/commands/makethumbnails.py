@@ -0,0 +1,28 @@
+"""Make the thumbnails for course images, see courses/thumbnails.py.
+
+Thumbnails are made when a course image is uploaded. Run this once for the
+images that were uploaded before, or with --all after changing the sizes.
+Images that could not be resized before are tried again.
+"""
+from django.core.management.base import BaseCommand
+
+from courses.models import Course
+from courses.thumbnails import THUMBNAILS_FAILED, update_course_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Make the thumbnails for course images that do not have them yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+            help='Make the thumbnails for every course image again.')
+
+    def handle(self, *args, **options):
+        courses = Course.objects.exclude(image_path='')
+        if not options['all']:
+            courses = courses.filter(image_thumbnails__in=('', THUMBNAILS_FAILED))
+        count = 0
+        for pk in courses.values_list('pk', flat=True):
+            if update_course_thumbnails(pk) is not None:
+                count += 1
+        self.stdout.write('Made thumbnails for {} courses.'.format(count))
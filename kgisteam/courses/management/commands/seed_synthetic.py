@@ -0,0 +1,210 @@
+"""Fill the database with synthetic courses, for benchmarks.
+
+Usage: manage.py seed_synthetic [--years 1] [--courses 4] [--worksheets 10]
+    [--problems 10] [--lessons 60] [--resources 6] [--seed 0] [--clear]
+
+A full size school is e.g. --years 5 --courses 40 --worksheets 200
+--problems 30. Synthetic courses are named 'Synthetic <n>', and --clear
+deletes them (with their syllabi, worksheets and problems) first. Rows are
+inserted with bulk_create, so the fields that Problem.save would fill in
+are calculated here.
+"""
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from courses.maths import compile_answer
+from courses.models import ( Course, Lesson, Problem, Resource, Syllabus,
+    Worksheet )
+from courses.numformat import sn_round
+from courses.pagecache import forget_pages
+from courses.routing import forget_routes
+from courses.variables import parse_variables
+
+
+NAME_PREFIX = 'Synthetic'
+TITLE_PREFIX = 'synthetic'
+# Every problem gets its own text, variables and answer from these, so that
+# the markdown and answer key caches see as many distinct texts as real
+# worksheets would.
+OBJECTS = ('cart', 'block', 'sled', 'ball', 'crate', 'trolley', 'puck', 'drone')
+VARIABLE_NAMES = ('m', 'F', 't', 'v', 'd', 'k', 'x', 'y', 'h', 'r', 'p', 'q')
+ANSWERS = (
+    '{c} * ${a} / ${b} * ${x}**2',
+    '({c} * ${a} + ${b}) / ${x}',
+    '${a} * ${b} - {c} * ${x}',
+    'sqrt({c} * ${a} * ${b}) + ${x}',
+    '${a} / (${b} + {c} * ${x})',
+    '${a}**2 / ({c} * ${b} * ${x})',
+)
+QUESTION = '''A {object} with ${a} kg is pushed with ${b} N for ${x} s.
+
+1. Draw a free body diagram of the {object}.
+2. What is the **acceleration** of the {object}, \\( \\frac{{${b}}}{{${a}}} \\)?
+3. How far does it travel, starting from rest?
+
+| Quantity | Value |
+|----------|-------|
+| {a}      | ${a}  |
+| {b}      | ${b}  |
+| {x}      | ${x}  |
+'''
+HINTS = (
+    '> Use *significant figures* in your answer.',
+    'Give the answer in **{units}**.',
+    'See [the textbook](https://example.com/{n}) for a worked example.',
+)
+SOLUTION = '''Substituting the values into \\( {answer} \\) gives
+
+\\[ {substituted} \\]
+
+which is **$calculated_answer {units}**. See [the textbook](https://example.com)
+for more problems like this one.
+'''
+UNITS = ('m', 's', 'N', 'm/s', 'kg', 'J')
+
+
+def synthetic_problem(worksheet: Worksheet, rng: random.Random) -> Problem:
+    """A problem with randomizable variables and long markdown.
+
+    The names and ranges of the variables, the answer and the text are
+    picked with rng, so the problems differ like those of real worksheets.
+    """
+    a, b, x = rng.sample(VARIABLE_NAMES, 3)
+    names = {'a': a, 'b': b, 'x': x}
+    variables = ', '.join(
+        '{}[{}, {}, {}{}]'.format(name, low + 1, low, low + rng.randint(5, 100),
+            ', 1' if rng.random() < 0.3 else '')
+        for name, low in ( (name, rng.randint(1, 20)) for name in (a, b, x) )
+    )
+    answer = rng.choice(ANSWERS).format(c=rng.choice((0.5, 2, 3, 9.81, 1.5)), **names)
+    units = rng.choice(UNITS)
+    spec = parse_variables(variables)
+    defaults = { variable.name: sn_round(variable.default) for variable in spec.variables }
+    question = QUESTION.format(object=rng.choice(OBJECTS), **names)
+    question += '\n' + '\n\n'.join( hint.format(units=units, n=rng.randint(1, 100))
+        for hint in rng.sample(HINTS, rng.randint(1, len(HINTS))) ) + '\n'
+    solution = SOLUTION.format(
+        answer=answer.replace('$', ''),
+        substituted=answer.replace('**', '^').replace('*', r' \times '),
+        units=units,
+    )
+    return Problem(
+        worksheet=worksheet,
+        question=question,
+        variables_with_values=variables,
+        variables_spec=spec.to_json(),
+        answer=answer,
+        calculated_answer=sn_round(compile_answer(answer)(defaults)),
+        answer_units=units,
+        solution=solution * rng.randint(1, 3),
+    )
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with synthetic courses for benchmarks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--years', type=int, default=1)
+        parser.add_argument('--courses', type=int, default=4, help='Courses per year.')
+        parser.add_argument('--worksheets', type=int, default=10, help='Worksheets per course.')
+        parser.add_argument('--problems', type=int, default=10, help='Problems per worksheet.')
+        parser.add_argument('--lessons', type=int, default=60, help='Lessons per syllabus.')
+        parser.add_argument('--resources', type=int, default=6, help='Resources per course.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--clear', action='store_true',
+            help='Delete the synthetic courses that already exist first.')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        if options['clear']:
+            self.clear()
+        this_year = timezone.now().year
+        schools = [
+            (school, nen, kumi)
+            for school, kumis in (
+                (Course.MIDDLESCHOOL, Course.MS_KUMI_CHOICES),
+                (Course.HIGHSCHOOL, Course.HS_KUMI_CHOICES),
+            )
+            for nen, _ in Course.NEN_CHOICES
+            for kumi, _ in kumis
+        ]
+        counts = dict.fromkeys(['courses', 'worksheets', 'problems', 'lessons'], 0)
+        for year in range(this_year - options['years'] + 1, this_year + 1):
+            for i in range(0, options['courses']):
+                with transaction.atomic():
+                    self.seed_course(year, i, schools[i % len(schools)], rng, options, counts)
+        forget_routes()
+        forget_pages()
+        self.stdout.write(', '.join(
+            '{} {}'.format(count, name) for name, count in counts.items()
+        ))
+
+    def seed_course(self, year, i, school_nen_kumi, rng, options, counts):
+        school, nen, kumi = school_nen_kumi
+        course = Course.objects.create(
+            year=year,
+            name='{} {}'.format(NAME_PREFIX, i),
+            school=school,
+            nen=nen,
+            kumi=kumi,
+            term1_start=timezone.datetime(year, 4, 1).date(),
+            term2_start=timezone.datetime(year, 9, 1).date(),
+            term3_start=timezone.datetime(year + 1, 1, 1).date(),
+            description='A synthetic course for benchmarks.',
+        )
+        syllabus = Syllabus.objects.create(course=course)
+        start = course.term1_start
+        Lesson.objects.bulk_create([
+            Lesson(
+                syllabus=syllabus,
+                number=n + 1,
+                date=start + timezone.timedelta(days=n * 300 // max(options['lessons'], 1)),
+                topics='Topic {}'.format(n + 1),
+                reading='pp. {}-{}'.format(10 * n, 10 * n + 9),
+                homework='Worksheet {}'.format(n + 1),
+                link0_URL='https://example.com/{}'.format(n),
+                link0_text='Slides',
+            )
+            for n in range(0, options['lessons'])
+        ])
+        for n in range(0, options['resources']):
+            resource = Resource.objects.create(
+                category=Resource.CATEGORY_CHOICES[n % len(Resource.CATEGORY_CHOICES)][0],
+                link_URL='https://example.com/resource/{}'.format(n),
+                link_text='Resource {}'.format(n),
+                description='A synthetic resource.',
+            )
+            resource.courses.add(course)
+        worksheets = Worksheet.objects.bulk_create([
+            Worksheet(title='{}-{}-{}-{}'.format(TITLE_PREFIX, year, i, n))
+            for n in range(0, options['worksheets'])
+        ])
+        if not all( worksheet.pk for worksheet in worksheets ):
+            # Backends that do not return the primary keys from bulk_create.
+            worksheets = list(Worksheet.objects.filter(
+                title__startswith='{}-{}-{}-'.format(TITLE_PREFIX, year, i),
+            ))
+        Worksheet.course.through.objects.bulk_create([
+            Worksheet.course.through(worksheet_id=worksheet.pk, course_id=course.pk)
+            for worksheet in worksheets
+        ])
+        Problem.objects.bulk_create([
+            synthetic_problem(worksheet, rng)
+            for worksheet in worksheets
+            for n in range(0, options['problems'])
+        ])
+        counts['courses'] += 1
+        counts['worksheets'] += len(worksheets)
+        counts['problems'] += len(worksheets) * options['problems']
+        counts['lessons'] += options['lessons']
+
+    def clear(self):
+        courses = Course.objects.filter(name__startswith='{} '.format(NAME_PREFIX))
+        Resource.objects.filter(courses__in=courses).delete()
+        Lesson.objects.filter(syllabus__course__in=courses).delete()
+        Syllabus.objects.filter(course__in=courses).delete()
+        Worksheet.objects.filter(title__startswith='{}-'.format(TITLE_PREFIX)).delete()
+        courses.delete()
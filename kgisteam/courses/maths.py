@@ -1,9 +1,23 @@
+import ast
+import operator
+import time
+from functools import lru_cache
+from string import Template
+
 from math import sin as sin_rads
 from math import cos as cos_rads
 from math import tan as tan_rads
 
+import numpy as np
+
+# The rounding functions live in courses.numformat, they are imported here so
+# that older code (e.g. migrations) can keep importing them from courses.maths.
+from courses.numformat import sn_round, sn_round_array, sn_round_str
+from courses.metrics import EVAL_SECONDS
+from courses.tracing import timed
+
 # BEGIN funcitons that can be used in the forms.
-from math import radians, sqrt
+from math import isfinite, log2, radians, sqrt
 
 
 def sin(theta):
@@ -16,30 +30,243 @@ def tan(theta):
     return tan_rads(radians(theta))
 # END functions that can be used in the forms.
 
-def evaluate_answer(string: str) -> float:
-    return eval(string)
+# BEGIN vectorized versions of the functions above, for numpy arrays.
+def sin_array(theta):
+    return np.sin(np.radians(theta))
+
+def cos_array(theta):
+    return np.cos(np.radians(theta))
+
+def tan_array(theta):
+    return np.tan(np.radians(theta))
+# END vectorized functions.
+
+ANSWER_FUNCTIONS = {
+    'cos': cos,
+    'radians': radians,
+    'sin': sin,
+    'sqrt': sqrt,
+    'tan': tan,
+}
+ANSWER_ARRAY_FUNCTIONS = {
+    'cos': cos_array,
+    'radians': np.radians,
+    'sin': sin_array,
+    'sqrt': np.sqrt,
+    'tan': tan_array,
+}
+ANSWER_OPERATORS = (
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+    ast.UAdd, ast.USub,
+)
+# Placeholders are renamed to this prefix before parsing, so that a variable
+# can never shadow one of the ANSWER_FUNCTIONS.
+_VARIABLE_PREFIX = '_var_'
+
+
+class ExpressionError(ValueError):
+    """The expression is not a valid answer expression."""
+
+
+class CompiledAnswer:
+    """An answer expression that has been parsed and compiled once.
+
+    Call it with a dict of { variable_name: value } to evaluate it, or use
+    evaluate_array with a dict of { variable_name: numpy array } to evaluate
+    it for many sets of variables at once.
+    """
+    def __init__(self, code, variables: frozenset):
+        self._code = code
+        self._function = eval(code, {'__builtins__': {}, **ANSWER_FUNCTIONS})
+        self._array_function = None
+        self.variables = variables
+
+    def __call__(self, variables: dict = None) -> float:
+        try:
+            with timed('eval', EVAL_SECONDS):
+                return self._function(variables or dict())
+        except KeyError as error:
+            raise ExpressionError('Undefined variable: {}'.format(error))
+
+    def evaluate_array(self, variables: dict, size: int) -> 'numpy.ndarray':
+        """Return an array with the answer for each of the size variable sets."""
+        if self._array_function is None:
+            self._array_function = eval(
+                self._code,
+                {'__builtins__': {}, **ANSWER_ARRAY_FUNCTIONS},
+            )
+        try:
+            with np.errstate(all='ignore'), timed('eval', EVAL_SECONDS):
+                answers = self._array_function(variables)
+        except KeyError as error:
+            raise ExpressionError('Undefined variable: {}'.format(error))
+        return np.broadcast_to(np.asarray(answers, dtype=float), (size,)).copy()
+
+
+class _PlaceholderTransformer(ast.NodeTransformer):
+    """Check the nodes in an answer and turn placeholders into dict lookups."""
+
+    def __init__(self):
+        self.variables = set()
+
+    def generic_visit(self, node):
+        if not isinstance(node, (ast.Expression, ast.BinOp, ast.UnaryOp,
+                ast.Call, ast.Constant, ast.Name, ast.Load) + ANSWER_OPERATORS):
+            raise ExpressionError(
+                'Not allowed in an answer: {}'.format(type(node).__name__)
+            )
+        return super().generic_visit(node)
+
+    def visit_Constant(self, node):
+        if type(node.value) not in (int, float):
+            raise ExpressionError('Only numbers are allowed in an answer.')
+        return node
+
+    def visit_Call(self, node):
+        if not (isinstance(node.func, ast.Name)
+                and node.func.id in ANSWER_FUNCTIONS
+                and len(node.args) == 1
+                and not node.keywords):
+            raise ExpressionError('Unknown function in answer.')
+        node.args = [ self.visit(arg) for arg in node.args ]
+        return node
+
+    def visit_Name(self, node):
+        if not node.id.startswith(_VARIABLE_PREFIX):
+            raise ExpressionError('Unknown name in answer: {}'.format(node.id))
+        name = node.id[len(_VARIABLE_PREFIX):]
+        self.variables.add(name)
+        lookup = ast.Subscript(
+            value=ast.Name(id='_variables', ctx=ast.Load()),
+            slice=ast.Constant(value=name),
+            ctx=ast.Load(),
+        )
+        return ast.copy_location(lookup, node)
+
+
+def _rename_placeholder(match) -> str:
+    name = match.group('named') or match.group('braced')
+    if name is None:
+        raise ExpressionError('Invalid placeholder in answer.')
+    return ' {}{} '.format(_VARIABLE_PREFIX, name)
+
+@lru_cache(maxsize=1024)
+def compile_answer(answer: str) -> CompiledAnswer:
+    """Parse an answer template such as '$x * sin(${theta})' once.
+
+    Only numbers, arithmetic, $variables and the ANSWER_FUNCTIONS are allowed.
+    The result is cached on the text of the answer, so each distinct answer is
+    parsed and compiled a single time per process.
+    """
+    expression = Template.pattern.sub(_rename_placeholder, answer)
+    try:
+        tree = ast.parse(expression.strip(), mode='eval')
+    except (SyntaxError, ValueError, RecursionError):
+        raise ExpressionError('Answer is not a valid mathematical expression.')
+    transformer = _PlaceholderTransformer()
+    body = transformer.visit(tree).body
+    # Wrap the expression in a lambda so evaluating it is a plain call.
+    function_tree = ast.parse('lambda _variables: 0', mode='eval')
+    function_tree.body.body = body
+    ast.fix_missing_locations(function_tree)
+    code = compile(function_tree, '<answer>', 'eval')
+    return CompiledAnswer(code, frozenset(transformer.variables))
+
+# Limits for expressions typed in by students, see evaluate_user_answer.
+USER_ANSWER_MAX_LENGTH = 100
+USER_ANSWER_MAX_NODES = 60
+# Every value has to fit in a float, which overflows at 2**1024.
+USER_ANSWER_MAX_BITS = 1024
+USER_ANSWER_TIME_BUDGET = 0.05 # seconds
+
+_BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+_UNARY_OPERATORS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+
+class _BoundedEvaluator:
+    """Walk an expression tree, checking the limits before each operation."""
+
+    def __init__(self, deadline: float):
+        self.deadline = deadline
+
+    def evaluate(self, node):
+        if time.perf_counter() > self.deadline:
+            raise ExpressionError('Expression took too long to evaluate.')
+        if isinstance(node, ast.Expression):
+            return self.evaluate(node.body)
+        elif isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            return self.checked(node.value)
+        elif isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPERATORS:
+            return _UNARY_OPERATORS[type(node.op)](self.evaluate(node.operand))
+        elif isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+            left, right = self.evaluate(node.left), self.evaluate(node.right)
+            if isinstance(node.op, ast.Pow):
+                self.check_power(left, right)
+            return self.checked(_BINARY_OPERATORS[type(node.op)](left, right))
+        elif (isinstance(node, ast.Call)
+                and isinstance(node.func, ast.Name)
+                and node.func.id in ANSWER_FUNCTIONS
+                and len(node.args) == 1
+                and not node.keywords):
+            argument = self.evaluate(node.args[0])
+            return self.checked(ANSWER_FUNCTIONS[node.func.id](argument))
+        raise ExpressionError(
+            'Not allowed in an answer: {}'.format(type(node).__name__)
+        )
+
+    def check_power(self, base, exponent):
+        """Reject a power whose result would not fit in a float.
+
+        Its size in bits is estimated before it is computed, as the exponent
+        times the bits of the base. Bases of 0 and 1 never grow, and negative
+        exponents only make the result smaller (or a fraction).
+        """
+        if abs(base) <= 1 or exponent <= 0:
+            return
+        if exponent * log2(abs(base)) > USER_ANSWER_MAX_BITS:
+            raise ExpressionError('Number is too large.')
+
+    def checked(self, value):
+        if isinstance(value, int):
+            if value.bit_length() > USER_ANSWER_MAX_BITS:
+                raise ExpressionError('Number is too large.')
+        elif not isinstance(value, float) or not isfinite(value):
+            raise ExpressionError('Not a finite number.')
+        return value
 
-def sn_round(number: float) -> float:
-    """Round with scientific notation."""
-    scientific_notation_str = '{:.2e}'.format(number)
-    num_str, order_str = scientific_notation_str.split('e')
-    rounded_num = round(eval(num_str), 3)
-    num_str = str(rounded_num)
-    scientific_notation_str = 'e'.join((num_str, order_str))
-    return eval('{:.2e}'.format(number))
 
-def sn_round_str(number: float) -> str:
-    """Round with scientific notation.
+def evaluate_user_answer(expression: str) -> float:
+    """Safely evaluate an untrusted expression, e.g. a student's answer.
 
-    This formats long numbers so that they can be rendered in scientific
-    notation in MathJax.
+    The same operators and functions as compile_answer are allowed, but no
+    variables. The length, the number of nodes, the size of exponents and
+    integers, and the time spent are all limited, so that input like
+    '9**9**9**9' is rejected instead of tying up the worker.
     """
-    if number < 0.00001 or number > 100000:
-        rounded = '{:.2e}'.format(number)
-        value, order = rounded.split('e')
-        if order.startswith('+'):
-            order = order[1:].lstrip('0')
-        order = '{' + order + '}'
-        return '{value} \\times 10^{order}'.format(value=value, order=order)
-    else:
-        return str(number)
+    if len(expression) > USER_ANSWER_MAX_LENGTH:
+        raise ExpressionError('Expression is too long.')
+    try:
+        tree = ast.parse(expression.strip(), mode='eval')
+    except (SyntaxError, ValueError, RecursionError, MemoryError):
+        raise ExpressionError('Not a number or mathematical expression.')
+    if sum(1 for _ in ast.walk(tree)) > USER_ANSWER_MAX_NODES:
+        raise ExpressionError('Expression is too long.')
+    evaluator = _BoundedEvaluator(time.perf_counter() + USER_ANSWER_TIME_BUDGET)
+    try:
+        with timed('eval', EVAL_SECONDS):
+            return evaluator.evaluate(tree)
+    except (ArithmeticError, ValueError, TypeError, RecursionError) as error:
+        if isinstance(error, ExpressionError):
+            raise
+        raise ExpressionError('Not a number or mathematical expression.')
@@ -0,0 +1,316 @@
+"""Counters and histograms aggregated across requests, for Prometheus.
+
+The metrics are kept in memory by each process. When COURSES_METRICS_DIR is
+set (see the settings) every process that serves requests also writes its
+values to metrics-<pid>.json in that directory, at most every FLUSH_SECONDS
+and when it exits, and the metrics view adds up the files of all the
+processes, so every gunicorn worker serves the totals. The directory has to
+be shared by the workers of one host, and not by other hosts, because the
+pids are checked. It is only set for the server: the tests, the management
+commands and the benchmarks would add requests that never happened. Without
+it every worker only reports its own values.
+
+Each file is replaced atomically and only ever written by its own process,
+so no locks are needed to write them. When the metrics are collected the
+files of the processes that are no longer running are added to the process
+that collects them and deleted, under a lock, so the counters never go down
+and the directory does not grow with every worker that gunicorn restarts.
+Left over temporary files are deleted after COURSES_METRICS_RETENTION
+seconds. A process that reuses the pid of an earlier one continues from its
+values.
+
+The cache hit ratios are hits / (hits + misses) of courses_cache_requests,
+and the checks per second are the rate of courses_answer_checks.
+https://prometheus.io/docs/instrumenting/exposition_formats/
+"""
+from bisect import bisect_left
+import atexit
+import fcntl
+import json
+import os
+import re
+import threading
+import time
+
+from django.conf import settings
+
+
+FLUSH_SECONDS = 5
+_PROCESS_FILE = re.compile(r'^metrics-(\d+)\.json$')
+_lock = threading.Lock()
+_metrics = dict() # name -> Counter or Histogram
+_flushed = {'time': 0.0, 'pid': None, 'at_exit': False}
+
+
+class Counter:
+    """A count that only goes up, with a value per set of labels."""
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = dict() # (label values) -> value
+        _metrics[name] = self
+
+    def label_values(self, labels: dict) -> tuple:
+        return tuple( str(labels[name]) for name in self.labelnames )
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self.label_values(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def merge(self, values: dict, key: tuple, value) -> None:
+        values[key] = values.get(key, 0) + value
+
+    def samples(self, values: dict):
+        """(name, labels, value) for the exposition format."""
+        for key, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Histogram(Counter):
+    """Observations counted in buckets, with their sum.
+
+    The values are the count in each bucket (not cumulative), the count
+    above the last bucket and the sum of the observations.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (),
+            buckets: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self.label_values(labels)
+        i = bisect_left(self.buckets, value)
+        with _lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[i] += 1
+            counts[-1] += value
+
+    def merge(self, values: dict, key: tuple, value) -> None:
+        if len(value) != len(self.buckets) + 2:
+            # Written by a process with other buckets.
+            return
+        counts = values.setdefault(key, [0] * len(value))
+        for i, count in enumerate(value):
+            counts[i] += count
+
+    def samples(self, values: dict):
+        for key, counts in sorted(values.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bucket, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bucket == float('inf') else repr(bucket)
+                yield '{}_bucket'.format(self.name), dict(labels, le=le), cumulative
+            yield '{}_sum'.format(self.name), labels, counts[-1]
+            yield '{}_count'.format(self.name), labels, cumulative
+
+
+REQUEST_SECONDS = Histogram(
+    'courses_request_seconds', 'Time to answer a request.', ['url_name'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+ANSWER_CHECKS = Counter(
+    'courses_answer_checks_total', 'Answers checked, by result.', ['result'],
+)
+CACHE_REQUESTS = Counter(
+    'courses_cache_requests_total', 'Lookups in the markdown and answer key caches.',
+    ['cache', 'result'],
+)
+EVAL_SECONDS = Histogram(
+    'courses_eval_seconds', 'Time to evaluate an answer expression.',
+    buckets=(1e-5, 5e-5, 1e-4, 5e-4, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5),
+)
+SESSION_BYTES = Histogram(
+    'courses_session_bytes', 'Size of the encoded session, when it is saved.',
+    buckets=(256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536),
+)
+
+
+def snapshot() -> dict:
+    """{ metric name: [[label values, value], ...] } of this process."""
+    with _lock:
+        return { name: [ [list(key), value if metric.kind == 'counter' else list(value)]
+                for key, value in metric.values.items() ]
+            for name, metric in _metrics.items() }
+
+def merge_snapshot(totals: dict, data: dict) -> None:
+    """Add a snapshot to totals, { metric name: { label values: value } }."""
+    for name, rows in data.items():
+        metric = _metrics.get(name)
+        if metric is None:
+            continue
+        for key, value in rows:
+            metric.merge(totals.setdefault(name, dict()), tuple(key), value)
+
+def metrics_dir() -> str:
+    return getattr(settings, 'COURSES_METRICS_DIR', None)
+
+def _process_path(directory: str, pid: int) -> str:
+    return os.path.join(directory, 'metrics-{}.json'.format(pid))
+
+def _read_file(path: str) -> dict:
+    """The totals of a metrics file, see merge_snapshot."""
+    totals = dict()
+    with open(path) as f:
+        merge_snapshot(totals, json.load(f))
+    return totals
+
+def _merge_totals(totals: dict, other: dict) -> None:
+    for name, values in other.items():
+        for key, value in values.items():
+            _metrics[name].merge(totals.setdefault(name, dict()), key, value)
+
+def _add_to_process(totals: dict) -> None:
+    """Add the totals of another process to the values of this one."""
+    with _lock:
+        for name, values in totals.items():
+            for key, value in values.items():
+                _metrics[name].merge(_metrics[name].values, key, value)
+
+def _is_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # It exists, but belongs to someone else.
+        return True
+    return True
+
+def flush(force: bool = False) -> None:
+    """Write the values of this process to its file in COURSES_METRICS_DIR."""
+    directory = metrics_dir()
+    now = time.monotonic()
+    if not directory or (not force and now - _flushed['time'] < FLUSH_SECONDS):
+        return
+    pid = os.getpid()
+    path = _process_path(directory, pid)
+    if _flushed['pid'] != pid:
+        # The first flush of this process, continue from an earlier process
+        # with the same pid.
+        _flushed['pid'] = pid
+        try:
+            _add_to_process(_read_file(path))
+        except (OSError, ValueError):
+            pass
+    _flushed['time'] = now
+    os.makedirs(directory, exist_ok=True)
+    temporary = '{}.tmp'.format(path)
+    with open(temporary, 'w') as f:
+        json.dump(snapshot(), f)
+    os.replace(temporary, path)
+
+def retire_processes(directory: str) -> None:
+    """Take over the files of the processes that are no longer running.
+
+    Their values are added to this process, so that the totals stay the
+    same, and the files are deleted. This has to hold the lock of collect.
+    """
+    retention = getattr(settings, 'COURSES_METRICS_RETENTION', 24 * 60 * 60)
+    retired = dict()
+    paths = list()
+    for filename in os.listdir(directory):
+        path = os.path.join(directory, filename)
+        match = _PROCESS_FILE.match(filename)
+        if match is None:
+            try:
+                if (filename.startswith('metrics-')
+                        and time.time() - os.path.getmtime(path) > retention):
+                    os.remove(path)
+            except OSError:
+                pass
+            continue
+        pid = int(match.group(1))
+        if pid == os.getpid() or _is_running(pid):
+            continue
+        try:
+            _merge_totals(retired, _read_file(path))
+        except OSError:
+            continue
+        except ValueError:
+            # Not a file that can be read, there is nothing to keep.
+            pass
+        paths.append(path)
+    if not paths:
+        return
+    _add_to_process(retired)
+    flush(force=True)
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def collect() -> dict:
+    """The totals of every process, or of this one if there is no directory."""
+    directory = metrics_dir()
+    totals = dict()
+    if not directory:
+        merge_snapshot(totals, snapshot())
+        return totals
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'collect.lock'), 'a') as lock:
+        # Released when the file is closed.
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        flush(force=True)
+        retire_processes(directory)
+        for filename in os.listdir(directory):
+            if not _PROCESS_FILE.match(filename):
+                continue
+            try:
+                _merge_totals(totals, _read_file(os.path.join(directory, filename)))
+            except (OSError, ValueError):
+                continue
+    return totals
+
+def _label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def render_metrics() -> str:
+    """The totals in the Prometheus text format."""
+    totals = collect()
+    lines = list()
+    for name, metric in _metrics.items():
+        lines.append('# HELP {} {}'.format(name, metric.documentation))
+        lines.append('# TYPE {} {}'.format(name, metric.kind))
+        for sample, labels, value in metric.samples(totals.get(name, dict())):
+            if labels:
+                sample += '{{{}}}'.format(','.join(
+                    '{}="{}"'.format(label, _label(label_value))
+                    for label, label_value in labels.items()))
+            lines.append('{} {}'.format(sample, repr(float(value))))
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """Observe the time of every request, and the size of saved sessions."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if not _flushed['at_exit']:
+            # Only processes that serve requests have anything to flush.
+            _flushed['at_exit'] = True
+            atexit.register(flush, force=True)
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            # Not the path, which would make a histogram for every 404.
+            url_name=match.view_name if match else 'unmatched',
+        )
+        session = getattr(request, 'session', None)
+        if session is not None and session.modified:
+            SESSION_BYTES.observe(len(session.encode(dict(session.items()))))
+        flush()
+        return response
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0028_add_terms_to_course'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='problem',
+            name='variables_spec',
+            field=models.TextField(blank=True, editable=False),
+        ),
+    ]
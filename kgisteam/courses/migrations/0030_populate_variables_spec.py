@@ -0,0 +1,27 @@
+from django.db import migrations
+
+from courses.variables import parse_variables
+
+
+def populate_variables_spec(apps, schema_editor):
+    """Data migration."""
+    Problem = apps.get_model('courses', 'Problem')
+    for problem in Problem.objects.all():
+        problem.variables_spec = parse_variables(problem.variables_with_values).to_json()
+        problem.save(update_fields=['variables_spec'])
+
+def clear_variables_spec(apps, schema_editor):
+    """Data migration."""
+    Problem = apps.get_model('courses', 'Problem')
+    Problem.objects.update(variables_spec='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0029_problem_variables_spec'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_variables_spec, clear_variables_spec),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0030_populate_variables_spec'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorksheetProgress',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_modified', models.DateTimeField(auto_now=True)),
+                ('session_key', models.CharField(max_length=40)),
+                ('correct', models.TextField(blank=True)),
+                ('incorrect', models.TextField(blank=True)),
+                ('worksheet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='courses.Worksheet')),
+            ],
+            options={
+                'verbose_name_plural': 'Worksheet progress',
+                'unique_together': {('session_key', 'worksheet')},
+            },
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0031_worksheetprogress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resource',
+            name='last_modified',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0032_resource_last_modified'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='image_thumbnails',
+            field=models.TextField(blank=True, editable=False),
+        ),
+    ]
@@ -1,16 +1,28 @@
+from bisect import bisect_right
+from datetime import date, timedelta
+import hashlib
 import random
 
-from markdown import markdown
+import numpy as np
 from martor.models import MartorField
-from string import Template
 from taggit.managers import TaggableManager
 
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models
+from django.db.models import Q
 from django.utils import timezone
 from django.urls import reverse
 
-from courses.maths import evaluate_answer, sn_round, sn_round_str
+from courses.answerkeys import answer_key, forget_answer_keys
+from courses.maths import compile_answer
+from courses.numformat import sn_round, sn_round_array, sn_round_str
+from courses.rendering import render_markdown
+from courses.thumbnails import THUMBNAILS_FAILED, Thumbnails, make_course_thumbnails_later
+from courses.variables import parse_variables, variables_spec_from_json
+
+
+# Course pk -> (start dates, valid from, valid until, term), see Course.term_now.
+_term_now = dict()
 
 
 class BaseModel(models.Model):
@@ -18,7 +30,7 @@ class BaseModel(models.Model):
     class Meta:
         abstract = True
 
-    last_modified = models.DateTimeField(auto_now=True)
+    last_modified = models.DateTimeField(auto_now=True, db_index=True)
 
 
 class Course(BaseModel):
@@ -40,6 +52,11 @@ class Course(BaseModel):
         ('D', 'D'),
         ('E', 'E'),
     )
+    TERM_TYPE_COUNTS = {
+        'semesters': 2,
+        'trimesters': 3,
+        'quarters': 4,
+    }
     HS_KUMI_CHOICES = (
         ('1', '1'),
         ('2', '2'),
@@ -124,13 +141,34 @@ class Course(BaseModel):
         blank=True,
         upload_to='courses',
     )
+    image_thumbnails = models.TextField(
+        blank=True,
+        editable=False,
+    )
+
+    @property
+    def thumbnails(self) -> 'Thumbnails':
+        """The thumbnails of the course image, see courses.thumbnails."""
+        if self.image_path and self.image_thumbnails not in ('', THUMBNAILS_FAILED):
+            return Thumbnails.from_json(self.image_thumbnails)
+        return None
 
     @property
     def resources(self):
-        """The resources that belong to the course."""
+        """The resources that belong to the course, grouped by category.
+
+        Returns { category label: [ resource, ... ] } for every category,
+        from a single query.
+        """
+        resources = {
+            category: list() for category, label in ResourceBaseClass.CATEGORY_CHOICES
+        }
+        for resource in self.resource_set.order_by('pk'):
+            if resource.category in resources:
+                resources[resource.category].append(resource)
         return {
-            category[1]: self.resource_set.filter(category=category[0])
-            for category in ResourceBaseClass.CATEGORY_CHOICES
+            label: resources[category]
+            for category, label in ResourceBaseClass.CATEGORY_CHOICES
         }
 
     @property
@@ -143,22 +181,49 @@ class Course(BaseModel):
         """Returns the number of terms for the course."""
         return len([ term for term in self.terms if term ])
 
+    @property
+    def term_boundaries(self) -> tuple:
+        """The start dates of the terms for the term_type, in order.
+
+        A date belongs to the term whose start is the last one on or before
+        it, dates before the first term belong to the last term.
+        """
+        term_count = self.TERM_TYPE_COUNTS.get(self.term_type, 0)
+        return tuple(self.terms[:term_count])
+
+    def term_of(self, day) -> int:
+        """The number of the term that a date is in, see term_boundaries."""
+        boundaries = self.term_boundaries
+        if not boundaries:
+            return None
+        return bisect_right(boundaries, day) or len(boundaries)
+
     @property
     def term_now(self):
-        """Returns the current term the course is in."""
-        term_now = 0
+        """Returns the current term the course is in.
+
+        The result is kept for the course (every instance of it, in this
+        process) until the next term starts, or until the start dates are
+        changed.
+        """
         today = timezone.now().date()
-        terms = self.terms
-        for i in range(0, 3):
-            if terms[i] and not terms[i+1]:
-                if terms[i] <= today:
-                    term_now = i+1
-            elif terms[i] and terms[i+1]:
-                if terms[i] <= today <= terms[i+1]:
-                    term_now = i+1
-        if term_now == 0 and terms[3]:
-            if terms[3] <= today:
-                term_now = 4
+        terms = tuple(self.terms)
+        cached = _term_now.get(self.pk)
+        if cached and cached[0] == terms and cached[1] <= today < cached[2]:
+            return cached[3]
+        starts = [ (start, i + 1) for i, start in enumerate(terms) if start ]
+        if terms[2] and terms[3]:
+            # The fourth term has always been counted from the day after it starts.
+            starts[-1] = (terms[3] + timedelta(days=1), 4)
+        position = bisect_right([ start for start, number in starts ], today)
+        if position == 0:
+            term_now = 0
+            valid_from = date.min
+        else:
+            valid_from, term_now = starts[position - 1]
+        valid_until = starts[position][0] if position < len(starts) else date.max
+        if self.pk is not None:
+            _term_now[self.pk] = (terms, valid_from, valid_until, term_now)
         return term_now
 
     @property
@@ -179,7 +244,15 @@ class Course(BaseModel):
         updated_nen_kumi = '{}-{}'.format(self.nen, self.kumi)
         if self.nen_kumi != updated_nen_kumi:
             self.nen_kumi = updated_nen_kumi
+        if self.pk and self.image_thumbnails:
+            # Forget the thumbnails of a replaced image.
+            stored_image = Course.objects.filter(pk=self.pk).values_list(
+                'image_path', flat=True).first()
+            if stored_image != self.image_path.name:
+                self.image_thumbnails = ''
         super().save(*args, **kwargs)
+        if self.image_path and not self.image_thumbnails:
+            make_course_thumbnails_later(self.pk)
 
     def __str__(self):
         """{name} ({school}: {nen_kumi}) {year}"""
@@ -201,6 +274,22 @@ class Syllabus(BaseModel):
         on_delete=models.SET_NULL,
     )
 
+    def lessons_in_term(self, term: int) -> 'QuerySet':
+        """The lessons in a term, with a single date range query.
+
+        See Course.term_boundaries for which term a lesson is in.
+        """
+        lessons = self.lesson_set.all()
+        boundaries = self.course.term_boundaries
+        if not 1 <= term <= len(boundaries):
+            return lessons.none()
+        in_term = Q(date__gte=boundaries[term - 1])
+        if term < len(boundaries):
+            in_term &= Q(date__lt=boundaries[term])
+        else:
+            in_term |= Q(date__lt=boundaries[0])
+        return lessons.filter(in_term)
+
     def get_absolute_url(self):
         kwargs={
             'year': self.course.year,
@@ -300,31 +389,7 @@ class Lesson(BaseModel):
     @property
     def term_num(self):
         """Return the number for the term the syllabus is in."""
-        course = self.syllabus.course
-        term_type = course.term_type
-        if term_type == None:
-            return None
-        elif term_type == 'semesters':
-            if course.term1_start <= self.date < course.term2_start:
-                return 1
-            else:
-                return 2
-        elif term_type == 'trimesters':
-            if course.term1_start <= self.date < course.term2_start:
-                return 1
-            elif course.term2_start <= self.date < course.term3_start:
-                return 2
-            else:
-                return 3
-        elif term_type == 'quarters':
-            if course.term1_start <= self.date < course.term2_start:
-                return 1
-            elif course.term2_start <= self.date < course.term3_start:
-                return 2
-            elif course.term3_start <= self.date < course.term4_start:
-                return 3
-            else:
-                return 4
+        return self.syllabus.course.term_of(self.date)
 
 
 class Worksheet(BaseModel):
@@ -389,6 +454,10 @@ class Problem(BaseModel):
             )
         ],
     )
+    variables_spec = models.TextField(
+        blank=True,
+        editable=False,
+    )
     answer = models.CharField(
         max_length=100,
     )
@@ -411,86 +480,113 @@ class Problem(BaseModel):
         """Return a unique html id to be used in the templates."""
         return 'problem-pk{}'.format(self.pk)
 
+    @property
+    def variables(self) -> 'VariablesSpec':
+        """The parsed variables_with_values, see courses.variables.
+
+        The spec that was stored on save is used as long as it matches
+        variables_with_values, otherwise the string is parsed (and cached).
+        """
+        spec = self.__dict__.get('_variables')
+        if spec is None or spec.source != self.variables_with_values:
+            spec = None
+            if self.variables_spec:
+                stored_spec = variables_spec_from_json(self.variables_spec)
+                if stored_spec.source == self.variables_with_values:
+                    spec = stored_spec
+            if spec is None:
+                spec = parse_variables(self.variables_with_values)
+            self._variables = spec
+        return spec
+
     @property
     def variables_as_lists(self) -> dict:
         """Return dict { variable_name: [default_value, min, max, is_int] }"""
-        if self.variables_with_values:
-            variables = dict()
-            for _ in [ var.strip() for var in self.variables_with_values.split('],') ]:
-                # Trim the brackets
-                variable_name, variable_values = _.split('[')
-                variable_values = variable_values.replace(']', '')
-                # Convert the numbers into a list.
-                variables[variable_name] = [ float(value) for value in variable_values.split(', ') ]
-            return variables
-        else:
-            return dict()
+        return { variable.name: variable.as_list()
+            for variable in self.variables.variables
+        }
 
     @property
     def variables_as_floats(self) -> dict:
         """Return { variable: value }"""
         if self.use_vars:
             return self.use_vars
-        elif self.variables_with_values:
-            return { key: sn_round(value[0])
-                for key, value
-                in self.variables_as_lists.items()
-            }
         else:
-            return dict()
+            return { variable.name: sn_round(variable.default)
+                for variable in self.variables.variables
+            }
 
     @property
     def variables_as_strings(self) -> dict:
         """Return { variable: value }"""
-        if self.use_vars:
-            return { key: sn_round_str(value)
-                for key, value
-                in self.use_vars.items()
-            }
-        elif self.variables_with_values:
-            return { key: sn_round_str(value)
-                for key, value
-                in self.variables_as_floats.items()
-            }
-        else:
-            return dict()
+        return { key: sn_round_str(value)
+            for key, value
+            in self.variables_as_floats.items()
+        }
 
     @property
     def is_randomizable(self) -> bool:
         """Determine if the numbers in a problem can be randomized."""
-        is_randomizable = False
-        if self.variables_as_lists:
-            for name, value in self.variables_as_lists.items():
-                len_value = len(value)
-                if len_value == 4 or len_value == 3:
-                    if value[1] != value[2]:
-                        is_randomizable = True
-                if len_value == 2:
-                    if value[0] != value[1]:
-                        is_randomizable = True
-                if len_value == 1 and not is_randomizable:
-                    is_randomizable = False
-        return is_randomizable
-
-    def variables_randomized(self) -> dict:
-        """Return { variable_name: randomized_value }"""
+        return self.variables.is_randomizable
+
+    def variables_randomized(self, seed: int = None) -> dict:
+        """Return { variable_name: randomized_value }
+
+        With a seed the values are reproducible: the same seed, problem and
+        variables always give the same values, in any process.
+        """
         vars = dict()
-        if self.variables_as_lists:
-            for name, value in self.variables_as_lists.items():
-                len_value = len(value)
-                if len_value == 4:
-                    if value[3]:
-                        vars[name] = int(sn_round(random.uniform(value[1], value[2])))
-                    else:
-                        vars[name] = sn_round(random.uniform(value[1], value[2]))
-                elif len_value == 3:
-                    vars[name] = sn_round(random.uniform(value[1], value[2]))
-                elif len_value == 2:
-                    vars[name] = sn_round(random.uniform(value[0], value[1]))
-                else:
-                    vars[name] = sn_round(value[0])
+        if self.variables.has_variables:
+            if seed is None:
+                rng = random
+            else:
+                seed_str = '{}-{}-{}'.format(seed, self.pk, self.variables.source)
+                rng = random.Random(hashlib.sha256(seed_str.encode()).digest())
+            for variable in self.variables.variables:
+                value = sn_round(rng.uniform(variable.min, variable.max))
+                vars[variable.name] = int(value) if variable.is_int else value
             return vars
 
+    @property
+    def variable_names(self) -> list:
+        """The order of the columns used by the array methods below."""
+        return self.variables.names
+
+    def variables_randomized_array(self, count: int) -> 'numpy.ndarray':
+        """Return a (count x variables) array of randomized values.
+
+        The vectorized version of self.variables_randomized, with the columns
+        in the order of self.variable_names.
+        """
+        rng = np.random.default_rng()
+        columns = list()
+        for variable in self.variables.variables:
+            column = sn_round_array(rng.uniform(variable.min, variable.max, count))
+            if variable.is_int:
+                column = np.trunc(column)
+            columns.append(column)
+        if not columns:
+            return np.empty((count, 0))
+        return np.column_stack(columns)
+
+    def calculate_answers(self, values) -> 'numpy.ndarray':
+        """Compute the answer for every row of an (N x variables) array.
+
+        The columns of values are in the order of self.variable_names. This
+        is the vectorized version of self.calculate_answer and returns N
+        rounded answers.
+        """
+        values = np.asarray(values, dtype=float)
+        if values.ndim != 2 or values.shape[1] != len(self.variable_names):
+            raise ValueError(
+                'Expected an array of shape (N, {}).'.format(len(self.variable_names))
+            )
+        variables = {
+            name: values[:, i] for i, name in enumerate(self.variable_names)
+        }
+        answers = compile_answer(self.answer).evaluate_array(variables, len(values))
+        return sn_round_array(answers)
+
     def use_variables(self, use_vars: dict) -> None:
         """Hook for passing variables into a problem."""
         self.use_vars = use_vars
@@ -498,15 +594,13 @@ class Problem(BaseModel):
     @property
     def question_markdown(self):
         """
-        Use a template to substitute variables.
+        Use a template to substitute variables, see courses.rendering.
         https://docs.python.org/3/library/string.html#template-strings
         """
-        if self.variables_with_values:
-            question_template = Template(self.question)
-            question = question_template.safe_substitute(**self.variables_as_strings)
-            return markdown(question)
+        if self.variables.has_variables:
+            return render_markdown(self.question, self.variables_as_strings)
         else:
-            return markdown(self.question)
+            return render_markdown(self.question)
 
     @property
     def solution_markdown(self):
@@ -514,62 +608,123 @@ class Problem(BaseModel):
         see the docstring for self.question_markdown
         """
         if self.worksheet.solutions_released:
-            if self.variables_with_values:
-                variables = self.variables_as_strings
-                variables['calculated_answer'] = self.calculated_answer
-                solution_template = Template(self.solution)
-                solution = solution_template.safe_substitute(**variables)
-                return markdown(solution)
-            else:
-                return markdown(self.solution)
+            return self.solution_markdown_released
         else:
                 release_datetime_local = timezone.localtime(self.worksheet.solution_release_datetime)
                 release_date_str = release_datetime_local.strftime('%y-%m-%d')
                 release_time_str = release_datetime_local.strftime('%H:%M')
-                return markdown(
+                return render_markdown(
                     'Solutions will be released on {release_date}, at {release_time}.'.format(
                         release_date=release_date_str,
                         release_time=release_time_str,
                     )
                 )
 
+    @property
+    def solution_markdown_released(self):
+        """The solution, regardless of the release date."""
+        if self.variables.has_variables:
+            variables = self.variables_as_strings
+            variables['calculated_answer'] = self.calculated_answer
+            return render_markdown(self.solution, variables)
+        else:
+            return render_markdown(self.solution)
+
     def calculate_answer(self):
         """Compute the answer to a problem.
 
         Calculate the answer to a problem using the default values for all
-        variables.
+        variables, or the values passed in with self.use_variables. The
+        answer is compiled once per distinct answer text, see
+        courses.maths.compile_answer.
 
         """
-        if self.use_vars:
-            answer_template = Template(self.answer)
-            answer = evaluate_answer(
-                answer_template.safe_substitute(**self.use_vars)
-            )
-        elif self.variables_with_values:
-            answer_template = Template(self.answer)
-            answer = evaluate_answer(
-                answer_template.safe_substitute(**self.variables_as_floats)
-            )
-        else:
-            answer = evaluate_answer(self.answer)
+        answer = compile_answer(self.answer)(self.variables_as_floats)
         answer_rounded = sn_round(answer)
         return answer_rounded
 
     def check_user_answer(self, user_answer):
-        if sn_round(user_answer) == self.calculated_answer:
+        """Compare with the default answer, then with the answer for use_vars.
+
+        The answer for use_vars comes from courses.answerkeys, so the answer
+        expression is only evaluated the first time a variable set is checked.
+        """
+        user_answer = sn_round(user_answer)
+        if user_answer == self.calculated_answer:
             return True
-        elif sn_round(user_answer) == self.calculate_answer():
+        elif user_answer == answer_key(self):
             return True
         else:
             return False
 
     def save(self, *args, **kwargs):
-        """Save the calculated_answer"""
+        """Save the parsed variables and the calculated_answer"""
+        self.variables_spec = self.variables.to_json()
         self.calculated_answer = self.calculate_answer()
         super().save(*args, **kwargs)  # Call the "real" save() method.
+        forget_answer_keys(self.pk)
+        if not self.use_vars:
+            # Render the default values now, most students will view them.
+            self.question_markdown
+            self.solution_markdown_released
+
+
+class WorksheetProgress(BaseModel):
+    """The problems in a worksheet that a visitor has checked.
+
+    There is one row per (session, worksheet), so checking an answer updates
+    a single small row instead of rewriting lists in the session that grow
+    with every worksheet a student has ever opened. The problem pks are
+    stored as comma separated strings.
+    """
+    class Meta:
+        unique_together = ('session_key', 'worksheet')
+        verbose_name_plural = 'Worksheet progress'
+
+    session_key = models.CharField(
+        max_length=40,
+    )
+    worksheet = models.ForeignKey(
+        Worksheet,
+        on_delete=models.CASCADE,
+    )
+    correct = models.TextField(
+        blank=True,
+    )
+    incorrect = models.TextField(
+        blank=True,
+    )
 
+    @staticmethod
+    def _pks(pks_str: str) -> list:
+        return [ int(pk) for pk in pks_str.split(',') if pk ]
 
-class ResourceBaseClass(models.Model):
+    @property
+    def correct_pks(self) -> list:
+        """The primary keys of correctly answered problems."""
+        return self._pks(self.correct)
+
+    @property
+    def incorrect_pks(self) -> list:
+        """The primary keys of incorrectly answered problems."""
+        return self._pks(self.incorrect)
+
+    def update_checked(self, responses: list) -> None:
+        """Apply the json responses of checked problems."""
+        correct, incorrect = set(self.correct_pks), set(self.incorrect_pks)
+        for response in responses:
+            pk = response['primary-key']
+            if response['result'] == 'correct':
+                correct.add(pk)
+                incorrect.discard(pk)
+            elif response['result'] == 'incorrect':
+                incorrect.add(pk)
+                correct.discard(pk)
+        self.correct = ','.join(str(pk) for pk in sorted(correct))
+        self.incorrect = ','.join(str(pk) for pk in sorted(incorrect))
+
+
+class ResourceBaseClass(BaseModel):
     """Define the catagories for the resources."""
     class Meta:
         abstract=True
@@ -0,0 +1,85 @@
+"""Round and format numbers to 3 significant figures.
+
+sn_round and sn_round_str are called for every variable of every problem on
+every request, so they avoid eval() and extra string handling. The *_array
+versions do the same work on numpy arrays for batches of problems.
+"""
+from math import floor, isfinite, log10
+
+import numpy as np
+
+
+# 10.0 ** n is an exact float for 0 <= n <= 22, so scaling by it only rounds once.
+_MAX_EXACT_POWER = 22
+_EXACT_POWERS = tuple(10.0 ** n for n in range(_MAX_EXACT_POWER + 1))
+# Scaled numbers this close to a rounding boundary are rounded by formatting.
+_TIE_TOLERANCE = 1e-6
+
+
+def sn_round(number: float) -> float:
+    """Round with scientific notation.
+
+    Equivalent to float('{:.2e}'.format(number)), i.e. rounding to 3
+    significant figures, but done arithmetically where that is exact.
+    """
+    if number and isfinite(number):
+        power = floor(log10(abs(number))) - 2
+        if -_MAX_EXACT_POWER <= power <= _MAX_EXACT_POWER:
+            if power >= 0:
+                scale = _EXACT_POWERS[power]
+                scaled = number / scale
+            else:
+                scale = _EXACT_POWERS[-power]
+                scaled = number * scale
+            digits = round(scaled)
+            if (abs(digits) >= 100
+                    and abs(abs(scaled - int(scaled)) - 0.5) > _TIE_TOLERANCE):
+                return digits * scale if power >= 0 else digits / scale
+    return float('{:.2e}'.format(number))
+
+def sn_round_array(numbers) -> 'numpy.ndarray':
+    """Vectorized sn_round.
+
+    Numbers that land too close to a rounding boundary for the arithmetic to
+    be trusted, and numbers that are zero, tiny or huge, fall back to sn_round
+    so the results are identical.
+    """
+    numbers = np.array(numbers, dtype=float)
+    with np.errstate(all='ignore'):
+        power = np.floor(np.log10(np.abs(numbers))) - 2
+        exact = np.abs(power) <= _MAX_EXACT_POWER
+        power = np.where(exact, power, 0)
+        scale = 10.0 ** np.abs(power)
+        scaled = np.where(power >= 0, numbers / scale, numbers * scale)
+        digits = np.rint(scaled)
+        rounded = np.where(power >= 0, digits * scale, digits / scale)
+        unsure = (
+            ~exact
+            | ~np.isfinite(rounded)
+            | (np.abs(digits) < 100)
+            | (np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) <= _TIE_TOLERANCE)
+        )
+    finite = np.isfinite(numbers)
+    unsure &= finite
+    rounded[unsure] = [ sn_round(number) for number in numbers[unsure] ]
+    rounded[~finite] = numbers[~finite]
+    return rounded
+
+def sn_round_str(number: float) -> str:
+    """Round with scientific notation.
+
+    This formats long numbers so that they can be rendered in scientific
+    notation in MathJax.
+    """
+    if number < 0.00001 or number > 100000:
+        rounded = '{:.2e}'.format(number)
+        value, _, order = rounded.partition('e')
+        if order[0] == '+':
+            order = order[1:].lstrip('0')
+        return '{} \\times 10^{{{}}}'.format(value, order)
+    else:
+        return str(number)
+
+def sn_round_str_array(numbers) -> list:
+    """Vectorized sn_round_str, returns a list of strings."""
+    return [ sn_round_str(number) for number in np.asarray(numbers).tolist() ]
@@ -0,0 +1,123 @@
+"""Cache whole pages that are the same for every anonymous visitor.
+
+The home, syllabus and resources pages and the sitemap only change when a
+Course, Syllabus, Lesson, Resource or Worksheet is edited. Their minified
+HTML (or XML) is stored in the 'pages' cache (see CACHES in the settings),
+together with a gzipped copy, so a repeat view is a single cache lookup and
+skips the ORM, the templates and htmlmin.
+
+The cache keys include the version of the content, which is read from the
+database once per request (see courses.versions), so a page that was edited
+by any process is made again on its next view. They also include the date,
+because the links to the current term change when a new term starts. Logged in users are never served from the
+cache, their pages have edit links.
+"""
+from collections import namedtuple
+from functools import wraps
+import gzip
+import hashlib
+import json
+import re
+
+from htmlmin.minify import html_minify
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+
+from courses.versions import content_version, forget_version
+
+
+PAGE_CACHE = 'pages'
+_accepts_gzip = re.compile(r'\bgzip\b')
+
+
+class CachedPage(namedtuple('CachedPage', ['content_type', 'content', 'gzip_content'])):
+    """A rendered page, as it is stored in the cache."""
+    __slots__ = ()
+
+    def response(self, request) -> 'HttpResponse':
+        """The page, gzipped if the client accepts it."""
+        if _accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            response = HttpResponse(self.gzip_content, content_type=self.content_type)
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(self.content, content_type=self.content_type)
+        response['Content-Length'] = len(response.content)
+        patch_vary_headers(response, ('Accept-Encoding',))
+        # The content has already been minified.
+        response.minify_response = False
+        return response
+
+
+def page_cache_key(request, view_name: str, kwargs: dict) -> str:
+    content = json.dumps(
+        [
+            content_version().token,
+            request.scheme,
+            request.get_host(),
+            view_name,
+            kwargs,
+            sorted(request.GET.items()),
+            timezone.now().date().isoformat(),
+        ],
+        sort_keys=True,
+    )
+    return 'page:{}'.format(hashlib.sha256(content.encode()).hexdigest())
+
+def _minify(content_type: str, content: bytes) -> bytes:
+    """Minify like htmlmin.middleware.HtmlMinifyMiddleware would."""
+    if ('text/html' not in content_type
+            or not getattr(settings, 'HTML_MINIFY', not settings.DEBUG)):
+        return content
+    return html_minify(
+        content,
+        ignore_comments=not getattr(settings, 'KEEP_COMMENTS_ON_MINIFYING', False),
+        parser=getattr(settings, 'HTML_MIN_PARSER', 'html5lib'),
+    ).encode()
+
+def cache_public_page(view=None, query_params: tuple = ()):
+    """Serve the view from the page cache to anonymous visitors.
+
+    Requests with a query string are not cached, except for the parameters
+    in query_params, which become part of the cache key.
+    """
+    if view is None:
+        return lambda view: cache_public_page(view, query_params)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (request.method not in ('GET', 'HEAD')
+                or any( param not in query_params for param in request.GET )
+                or request.user.is_authenticated):
+            return view(request, *args, **kwargs)
+        cache = caches[PAGE_CACHE]
+        key = page_cache_key(request, view.__name__, kwargs)
+        page = cache.get(key)
+        if page is None:
+            response = view(request, *args, **kwargs)
+            if not getattr(response, 'is_rendered', True):
+                response.render()
+            if (response.status_code != 200 or response.streaming
+                    or response.cookies or response.has_header('Content-Encoding')):
+                return response
+            content = _minify(response['Content-Type'], response.content)
+            page = CachedPage(
+                response['Content-Type'],
+                content,
+                gzip.compress(content),
+            )
+            cache.set(key, page)
+        return page.response(request)
+    return wrapper
+
+def forget_pages(*args, **kwargs) -> None:
+    """Drop the pages cached by this process.
+
+    Other processes see the change in the version of the content. The
+    arguments are ignored so that this can be used as a signal receiver.
+    """
+    forget_version()
+    caches[PAGE_CACHE].clear()
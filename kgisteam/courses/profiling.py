@@ -0,0 +1,169 @@
+"""Profile a single request on demand, for staff.
+
+A staff member adds ?profile to the url (or sends an X-Profile header) and
+ProfilingMiddleware runs the request under cProfile and tracemalloc. Each
+capture is saved in COURSES_PROFILE_DIR (see the settings) as
+
+    <name>.prof   the cProfile stats, for pstats or snakeviz
+    <name>.txt    the slowest functions and the top allocation sites
+    <name>.json   what was requested, by whom, and how long it took
+
+Only the newest COURSES_PROFILE_KEEP captures are kept. The captures are
+listed in the admin, see courses.views.admin_profiles.
+"""
+from datetime import datetime
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_TRIGGER = 'profile'
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+CAPTURE_NAME = re.compile(r'^\d{8}T\d{12}-\d+-[0-9a-f]{8}$')
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+# tracemalloc is global to the process, only one request can use it at once.
+_tracemalloc_lock = threading.Lock()
+
+
+def profile_dir() -> str:
+    return getattr(settings, 'COURSES_PROFILE_DIR',
+        os.path.join(settings.BASE_DIR, 'profiles'))
+
+def capture_path(name: str, extension: str) -> str:
+    return os.path.join(profile_dir(), '{}.{}'.format(name, extension))
+
+def list_captures() -> list:
+    """The metadata of the captures, newest first."""
+    try:
+        names = [ filename[:-len('.json')] for filename in os.listdir(profile_dir())
+            if filename.endswith('.json') ]
+    except FileNotFoundError:
+        return list()
+    captures = list()
+    for name in sorted(names, reverse=True):
+        if not CAPTURE_NAME.match(name):
+            continue
+        try:
+            with open(capture_path(name, 'json')) as f:
+                captures.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return captures
+
+def rotate_captures(keep: int) -> None:
+    """Delete all but the newest keep captures."""
+    for capture in list_captures()[keep:]:
+        for extension in ('prof', 'txt', 'json'):
+            try:
+                os.remove(capture_path(capture['name'], extension))
+            except FileNotFoundError:
+                pass
+
+def allocation_report(snapshot: 'tracemalloc.Snapshot') -> str:
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ])
+    lines = [ 'Top {} allocation sites'.format(TOP_ALLOCATIONS) ]
+    for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+        frame = stat.traceback[0]
+        lines.append('{:>10.1f} KiB {:>8} blocks  {}:{}'.format(
+            stat.size / 1024, stat.count, frame.filename, frame.lineno))
+    return '\n'.join(lines)
+
+def _write_capture(name: str, request, response, profiler: cProfile.Profile,
+        snapshot: 'tracemalloc.Snapshot', total_ms: float, peak: int) -> None:
+    os.makedirs(profile_dir(), exist_ok=True)
+    profiler.dump_stats(capture_path(name, 'prof'))
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+    with open(capture_path(name, 'txt'), 'w') as f:
+        f.write('{} {}\n\n'.format(request.method, request.get_full_path()))
+        f.write(stream.getvalue())
+        if snapshot is not None:
+            f.write('\n' + allocation_report(snapshot) + '\n')
+    match = getattr(request, 'resolver_match', None)
+    with open(capture_path(name, 'json'), 'w') as f:
+        json.dump({
+            'name': name,
+            'created': datetime.utcnow().isoformat() + 'Z',
+            'method': request.method,
+            'path': request.get_full_path(),
+            'url_name': match.view_name if match else None,
+            'user': request.user.get_username(),
+            'status': response.status_code,
+            'total_ms': round(total_ms, 3),
+            'peak_kib': round(peak / 1024, 1) if peak is not None else None,
+        }, f)
+
+def save_capture(request, response, profiler: cProfile.Profile,
+        snapshot: 'tracemalloc.Snapshot', total_ms: float, peak: int) -> str:
+    """Write the files of a capture, and return its name.
+
+    A capture that cannot be written is logged and its name is None, the
+    request goes on.
+    """
+    name = '{:%Y%m%dT%H%M%S%f}-{}-{}'.format(datetime.utcnow(), os.getpid(), uuid.uuid4().hex[:8])
+    try:
+        _write_capture(name, request, response, profiler, snapshot, total_ms, peak)
+        rotate_captures(getattr(settings, 'COURSES_PROFILE_KEEP', 50))
+    except OSError as error:
+        logger.warning('Cannot save the profile %s in %s: %s', name, profile_dir(), error)
+        return None
+    return name
+
+class ProfilingMiddleware:
+    """Profile the request if a staff member asks for it.
+
+    This has to come after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if ((PROFILE_TRIGGER not in request.GET and PROFILE_HEADER not in request.META)
+                or not request.user.is_staff):
+            return self.get_response(request)
+        # Another request, or someone else (e.g. a benchmark), may be tracing
+        # already, then this capture has no allocations.
+        trace_memory = _tracemalloc_lock.acquire(blocking=False)
+        if trace_memory and tracemalloc.is_tracing():
+            _tracemalloc_lock.release()
+            trace_memory = False
+        if trace_memory:
+            tracemalloc.start()
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+            total_ms = (time.perf_counter() - start) * 1000
+            snapshot, peak = None, None
+            if trace_memory:
+                snapshot = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            if trace_memory:
+                tracemalloc.stop()
+                _tracemalloc_lock.release()
+        name = save_capture(request, response, profiler, snapshot, total_ms, peak)
+        if name is not None:
+            response['X-Profile-Capture'] = name
+        return response
@@ -0,0 +1,151 @@
+"""Render problem markdown to HTML, with a content-addressed cache.
+
+Rendered HTML is stored in the 'markdown' cache (see CACHES in the settings)
+under a hash of the source text and the markdown configuration. Identical
+problems on different worksheets share entries, and the cache backend takes
+care of evicting the least recently used ones.
+
+Text with $variables is rendered once with the placeholders protected, and
+split into a list of segments that alternate between literal HTML and slots.
+The values for each student are then joined into the segments, so
+randomizing a problem never runs markdown again. The values are inserted
+as they are, which is the same as substituting them first only because they
+are numbers (see courses.numformat.sn_round_str) and each placeholder is
+between characters that markdown gives no meaning to. Other text cannot be
+compiled, it is substituted first and the result is cached like text
+without variables.
+"""
+from string import Template
+import hashlib
+import json
+import re
+
+import markdown as markdown_module
+from markdown import markdown
+
+from django.core.cache import caches
+
+from courses.metrics import CACHE_REQUESTS
+from courses.tracing import timed
+
+
+MARKDOWN_CACHE = 'markdown'
+MARKDOWN_EXTENSIONS = []
+MARKDOWN_EXTENSION_CONFIGS = {}
+# Stands in for a placeholder while rendering, markdown leaves it untouched.
+_SLOT_TOKEN = 'kgisteamslot{}x'
+_SLOT_PATTERN = re.compile(r'kgisteamslot(\d+)x')
+# What may come before a placeholder that starts a block, e.g. '> $n. '.
+_LINE_PREFIX = re.compile(r'[ \t>]*')
+# Characters next to a placeholder that cannot make markdown syntax with it,
+# besides letters and digits. Not e.g. '*', '_', '`', '\\', '<' or '&'.
+_PLAIN_NEIGHBOURS = frozenset(' \t\n.,;:?!=+-/|%\'"(){}[]')
+
+
+def markdown_cache_key(text: str, kind: str = 'html') -> str:
+    """A hash of everything that affects the rendered HTML."""
+    content = json.dumps(
+        [
+            kind,
+            text,
+            MARKDOWN_EXTENSIONS,
+            MARKDOWN_EXTENSION_CONFIGS,
+            markdown_module.__version__,
+        ],
+        sort_keys=True,
+    )
+    return 'markdown:{}'.format(hashlib.sha256(content.encode()).hexdigest())
+
+def _markdown(text: str) -> str:
+    return markdown(
+        text,
+        extensions=MARKDOWN_EXTENSIONS,
+        extension_configs=MARKDOWN_EXTENSION_CONFIGS,
+    )
+
+def _is_plain(text: str, start: int, end: int) -> bool:
+    """Whether the placeholder text[start:end] is between plain characters."""
+    before = text[start - 1] if start > 0 else ' '
+    after = text[end] if end < len(text) else ' '
+    if text[max(start - 2, 0):start] == '](':
+        # The url of a link.
+        return False
+    return all( char.isalnum() or char in _PLAIN_NEIGHBOURS for char in (before, after) )
+
+def compile_markdown_template(text: str) -> tuple:
+    """Render text with $variables into (html, slot, html, slot, ..., html).
+
+    Each slot is a tuple (variable_name, placeholder) where placeholder is the
+    original text, which is used if no value is given for the variable, just
+    like Template.safe_substitute. Returns None if the text cannot be
+    compiled: when a placeholder starts a line, because its value can change
+    the blocks (with n=5, '$n. apples' is a list), when it is next to
+    markdown syntax (in 'x*$n*y', '\\$n' or '`$n`' the value is part of the
+    emphasis, escape or code), or in the unlikely case that the text already
+    contains the token used to protect the placeholders.
+    """
+    if _SLOT_PATTERN.search(text):
+        return None
+    for match in Template.pattern.finditer(text):
+        if match.group('named') is None and match.group('braced') is None:
+            continue
+        line_start = text.rfind('\n', 0, match.start()) + 1
+        if _LINE_PREFIX.fullmatch(text, line_start, match.start()):
+            return None
+        if not _is_plain(text, match.start(), match.end()):
+            return None
+    slots = list()
+
+    def protect(match):
+        if match.group('escaped') is not None:
+            return '$'
+        name = match.group('named') or match.group('braced')
+        if name is None:
+            return match.group()
+        slots.append((name, match.group()))
+        return _SLOT_TOKEN.format(len(slots) - 1)
+
+    html = _markdown(Template.pattern.sub(protect, text))
+    segments = _SLOT_PATTERN.split(html)
+    for i in range(1, len(segments), 2):
+        segments[i] = slots[int(segments[i])]
+    return tuple(segments)
+
+def substitute_segments(segments: tuple, variables: dict) -> str:
+    """Join the values of the variables into a compiled template."""
+    return ''.join([
+        segment if i % 2 == 0 else str(variables.get(segment[0], segment[1]))
+        for i, segment in enumerate(segments)
+    ])
+
+def render_markdown(text: str, variables: dict = None) -> str:
+    """Substitute the variables into the text and render it as HTML.
+
+    When variables is None the text is rendered as is, without treating
+    $ as a placeholder.
+    https://docs.python.org/3/library/string.html#template-strings
+    """
+    with timed('markdown'):
+        return _render_markdown(text, variables)
+
+def _render_markdown(text: str, variables: dict = None) -> str:
+    cache = caches[MARKDOWN_CACHE]
+    if variables is None:
+        key = markdown_cache_key(text)
+        html = cache.get(key)
+        CACHE_REQUESTS.inc(cache='markdown', result='miss' if html is None else 'hit')
+        if html is None:
+            html = _markdown(text)
+            cache.set(key, html)
+        return html
+    key = markdown_cache_key(text, kind='template')
+    segments = cache.get(key)
+    CACHE_REQUESTS.inc(cache='markdown', result='miss' if segments is None else 'hit')
+    if segments is None:
+        # () remembers that the text cannot be compiled.
+        segments = compile_markdown_template(text) or ()
+        cache.set(key, segments)
+    if not segments:
+        # Cached by the substituted text instead.
+        return _render_markdown(Template(text).safe_substitute(**variables))
+    return substitute_segments(segments, variables)
@@ -0,0 +1,83 @@
+"""Find courses and worksheets from url kwargs without querying.
+
+Every course page resolves (year, school, name, nen_kumi) to a course, and
+the worksheet pages also resolve a worksheet title within the course. The
+rows needed for that are read with two queries into a per-process index,
+and each lookup builds fresh model instances from the index.
+
+The index is made for a version of the courses and worksheets, which is
+read from the database once per request (see courses.versions), and an
+index made for an older version is rebuilt on the next lookup. So a course or worksheet that
+is saved by one process is found by every other process on its next request.
+"""
+import threading
+
+from courses.models import Course, Worksheet
+from courses.versions import content_version, forget_version
+
+
+# What the index is made from, see courses.versions.
+ROUTING_MODELS = (Course, Worksheet, Worksheet.course.through)
+_index = None # (version, courses, worksheets)
+_lock = threading.Lock()
+
+
+def _rows(queryset) -> tuple:
+    """(field names, [ values, ... ]) for Model.from_db"""
+    names = [ field.attname for field in queryset.model._meta.concrete_fields ]
+    return names, list(queryset.values_list(*names))
+
+def _build_index(version: str) -> tuple:
+    course_names, course_rows = _rows(Course.objects.order_by('pk'))
+    courses = dict()
+    for row in course_rows:
+        course = dict(zip(course_names, row))
+        key = (course['year'], course['school'], course['name'], course['nen_kumi'])
+        courses.setdefault(key, row)
+    worksheet_names, worksheet_rows = _rows(Worksheet.objects.order_by('pk'))
+    worksheets_by_pk = { row[worksheet_names.index('id')]: row for row in worksheet_rows }
+    worksheets = dict() # course pk -> [ worksheet row, ... ]
+    for course_id, worksheet_id in (Worksheet.course.through.objects
+            .order_by('worksheet_id').values_list('course_id', 'worksheet_id')):
+        worksheets.setdefault(course_id, list()).append(worksheets_by_pk[worksheet_id])
+    return (
+        version,
+        (course_names, courses),
+        (worksheet_names, worksheets),
+    )
+
+def _get_index() -> tuple:
+    global _index
+    version = content_version(ROUTING_MODELS).token
+    index = _index
+    if index is None or index[0] != version:
+        with _lock:
+            if _index is None or _index[0] != version:
+                _index = _build_index(version)
+            index = _index
+    return index
+
+def find_course(year: int, school: str, name: str, nen_kumi: str) -> 'Course':
+    """The course with the given url kwargs, or None."""
+    version, (names, courses), worksheets = _get_index()
+    row = courses.get((year, school, name, nen_kumi))
+    if row is None:
+        return None
+    return Course.from_db(Course.objects.db, names, row)
+
+def course_worksheets(course: 'Course') -> list:
+    """The worksheets in a course, in the order they were created."""
+    version, courses, (names, worksheets) = _get_index()
+    return [ Worksheet.from_db(Worksheet.objects.db, names, row)
+        for row in worksheets.get(course.pk, list())
+    ]
+
+def forget_routes(*args, **kwargs) -> None:
+    """Rebuild the index of this process on the next lookup.
+
+    Other processes see the change in the version of the content. The
+    arguments are ignored so that this can be used as a signal receiver.
+    """
+    global _index
+    forget_version()
+    _index = None
@@ -0,0 +1,96 @@
+"""The sitemap, with the syllabus and the worksheets of every course.
+
+https://docs.djangoproject.com/en/3.0/ref/contrib/sitemaps/
+
+Each section reads everything it needs with a single joined query and builds
+the urls in Python, instead of following Syllabus.course for every entry.
+Up to MAX_SITEMAP_URLS urls are served in sitemap.xml, above that it becomes
+a sitemap index of the sections, as the sitemap protocol requires. The
+responses are kept in the page cache until a course, syllabus or worksheet
+changes, see courses.pagecache.
+"""
+from django.contrib.sitemaps import Sitemap
+from django.contrib.sitemaps import views as sitemaps_views
+from django.urls import reverse
+
+from courses.conditional import conditional_page, sitemap_validator
+from courses.models import Course, Syllabus, Worksheet
+from courses.pagecache import cache_public_page
+
+
+# The most urls in one sitemap, https://www.sitemaps.org/protocol.html
+MAX_SITEMAP_URLS = 50000
+_COURSE_FIELDS = ('year', 'school', 'name', 'nen_kumi')
+_TERM_FIELDS = ('term1_start', 'term2_start', 'term3_start', 'term4_start')
+
+
+class PrecomputedSitemap(Sitemap):
+    """A sitemap of (location, lastmod) items, read when it is made."""
+    limit = MAX_SITEMAP_URLS
+
+    def __init__(self, items: list):
+        self._items = items
+
+    def items(self) -> list:
+        return self._items
+
+    def location(self, item) -> str:
+        return item[0]
+
+    def lastmod(self, item):
+        return item[1]
+
+
+class SyllabusSitemap(PrecomputedSitemap):
+    priority = 0.5
+
+    def __init__(self):
+        fields = [ 'course__{}'.format(field) for field in _COURSE_FIELDS + _TERM_FIELDS ]
+        items = list()
+        for last_modified, *values in (Syllabus.objects
+                .filter(course__isnull=False)
+                .order_by('pk')
+                .values_list('last_modified', *fields)):
+            kwargs = dict(zip(_COURSE_FIELDS, values))
+            # The same term as Syllabus.get_absolute_url
+            kwargs['term'] = Course(**dict(zip(_TERM_FIELDS, values[len(_COURSE_FIELDS):]))).term_now
+            items.append((reverse('courses:syllabus', kwargs=kwargs), last_modified))
+        super().__init__(items)
+
+
+class WorksheetSitemap(PrecomputedSitemap):
+    priority = 0.4
+
+    def __init__(self):
+        fields = [ 'course__{}'.format(field) for field in _COURSE_FIELDS ]
+        items = list()
+        for title, last_modified, *values in (Worksheet.course.through.objects
+                .order_by('course_id', 'worksheet_id')
+                .values_list('worksheet__title', 'worksheet__last_modified', *fields)):
+            kwargs = dict(zip(_COURSE_FIELDS, values), title=title, order='ordered')
+            items.append((reverse('courses:worksheets', kwargs=kwargs), last_modified))
+        super().__init__(items)
+
+
+SITEMAPS = {
+    'courses': SyllabusSitemap,
+    'worksheets': WorksheetSitemap,
+}
+
+
+@sitemaps_views.x_robots_tag
+@conditional_page(sitemap_validator)
+@cache_public_page
+def sitemap(request):
+    """sitemap.xml, or a sitemap index if there are too many urls."""
+    sitemaps = { section: site() for section, site in SITEMAPS.items() }
+    if sum( len(site.items()) for site in sitemaps.values() ) <= MAX_SITEMAP_URLS:
+        return sitemaps_views.sitemap(request, sitemaps)
+    return sitemaps_views.index(request, sitemaps, sitemap_url_name='sitemap-section')
+
+@sitemaps_views.x_robots_tag
+@conditional_page(sitemap_validator)
+@cache_public_page(query_params=('p',))
+def sitemap_section(request, section):
+    """One section of the sitemap index, the page is in ?p="""
+    return sitemaps_views.sitemap(request, SITEMAPS, section=section)
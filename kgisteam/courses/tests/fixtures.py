@@ -0,0 +1,29 @@
+from django.shortcuts import reverse
+from django.utils import timezone
+
+from courses.models import Course, Problem, Worksheet
+from courses.viewaids import kwargs_from_course_and_worksheet
+
+
+class SumWorksheetMixin:
+    """A course with a worksheet of one problem, the sum of $x and $y.
+
+    The answer is 3 unless the worksheet is randomized.
+    """
+    course_name = 'Test Course'
+
+    def setUp(self):
+        super().setUp()
+        self.course = Course.objects.create(
+            year=timezone.now().year, name=self.course_name, school='MS', nen=1, kumi='A',
+        )
+        self.worksheet = Worksheet.objects.create(title='Test Worksheet')
+        self.course.worksheet_set.add(self.worksheet)
+        self.problem = Problem.objects.create(
+            question='What is the sum of $x and $y?',
+            variables_with_values='x[1, 0, 10], y[2, 0, 10]',
+            answer='$x + $y',
+            worksheet=self.worksheet,
+        )
+        self.worksheet_url = reverse('courses:worksheets',
+            kwargs=kwargs_from_course_and_worksheet(self.course, self.worksheet))
@@ -0,0 +1,46 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from courses.answerkeys import ANSWER_KEY_FIELDS, answer_key
+from courses.models import Problem
+
+
+class TestAnswerKeys(TestCase):
+    def setUp(self):
+        self.problem = Problem.objects.create(
+            question='What is $x + ${y}?',
+            variables_with_values='x[40, 0, 100], y[2, 0, 100]',
+            answer='$x + ${y}',
+        )
+
+    def lean_problem(self):
+        return Problem.objects.only(*ANSWER_KEY_FIELDS).get(pk=self.problem.pk)
+
+    def test_default_answer_is_not_evaluated(self):
+        problem = self.lean_problem()
+        with mock.patch.object(Problem, 'calculate_answer') as calculate_answer:
+            self.assertEqual(answer_key(problem), 42.0)
+            self.assertTrue(problem.check_user_answer(42))
+        calculate_answer.assert_not_called()
+
+    def test_randomized_answer_is_cached(self):
+        problem = self.lean_problem()
+        problem.use_variables({'x': 1.0, 'y': 2.0})
+        with self.assertNumQueries(0):
+            self.assertTrue(problem.check_user_answer(3))
+        with mock.patch.object(Problem, 'calculate_answer') as calculate_answer:
+            self.assertEqual(answer_key(problem), 3.0)
+            problem.use_variables({'y': 2.0, 'x': 1.0})
+            self.assertEqual(answer_key(problem), 3.0)
+        calculate_answer.assert_not_called()
+
+    def test_forgotten_on_save(self):
+        problem = self.lean_problem()
+        problem.use_variables({'x': 1.0, 'y': 2.0})
+        self.assertEqual(answer_key(problem), 3.0)
+        self.problem.answer = '$x * ${y}'
+        self.problem.save()
+        problem = self.lean_problem()
+        problem.use_variables({'x': 1.0, 'y': 2.0})
+        self.assertEqual(answer_key(problem), 2.0)
@@ -0,0 +1,77 @@
+from io import StringIO
+import json
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.test import LiveServerTestCase, TestCase
+
+from courses.models import Course, Problem, Worksheet
+
+
+class TestBenchmarks(TestCase):
+    def test_seed_synthetic(self):
+        call_command('seed_synthetic', courses=2, worksheets=3, problems=4,
+            lessons=5, resources=1, stdout=StringIO())
+        courses = Course.objects.filter(name__startswith='Synthetic ')
+        self.assertEqual(courses.count(), 2)
+        self.assertEqual(Worksheet.objects.filter(course__in=courses).count(), 6)
+        problems = Problem.objects.filter(worksheet__course__in=courses)
+        for problem in problems:
+            self.assertTrue(problem.variables.has_variables)
+            # What Problem.save would have calculated.
+            self.assertEqual(problem.calculated_answer, problem.calculate_answer())
+        # Every problem has its own text, so the caches are not all hits.
+        self.assertEqual(len({ problem.question for problem in problems }), 24)
+        self.assertGreater(len({ problem.answer for problem in problems }), 1)
+        # --clear replaces the synthetic courses instead of adding to them
+        call_command('seed_synthetic', courses=1, clear=True, stdout=StringIO())
+        self.assertEqual(courses.count(), 1)
+        self.assertFalse(Worksheet.objects.filter(course__isnull=True).exists())
+
+    def test_benchmark_routes(self):
+        call_command('seed_synthetic', courses=1, worksheets=2, problems=3,
+            lessons=5, resources=1, stdout=StringIO())
+        with tempfile.TemporaryDirectory() as directory, \
+                tempfile.TemporaryDirectory() as metrics_dir, \
+                self.settings(COURSES_METRICS_DIR=metrics_dir):
+            output = os.path.join(directory, 'benchmark.json')
+            call_command('benchmark_routes', requests=2, output=output, stdout=StringIO())
+            with open(output) as f:
+                report = json.load(f)
+            # Not counted as requests to the server.
+            self.assertEqual(os.listdir(metrics_dir), [])
+        self.assertEqual(report['requests'], 2)
+        self.assertEqual(report['target']['problems'], 3)
+        self.assertEqual(
+            { route['name'] for route in report['routes'] },
+            {'home', 'syllabus', 'resources', 'worksheets', 'worksheets-random',
+                'worksheets-check', 'worksheets-check-all', 'worksheets-check-results',
+                'worksheets-randomize', 'worksheets-reset', 'worksheets-reset-all'},
+        )
+        for route in report['routes']:
+            self.assertLessEqual(route['p50_ms'], route['max_ms'])
+        # Without --output or ALLOWED_HOSTS, which allows localhost when debugging.
+        with tempfile.TemporaryDirectory() as directory, \
+                self.settings(COURSES_BENCHMARK_DIR=directory, ALLOWED_HOSTS=[], DEBUG=True):
+            call_command('benchmark_routes', requests=1, stdout=StringIO())
+            [filename] = os.listdir(directory)
+        self.assertRegex(filename, r'^benchmark-\d{8}T\d{6}Z\.json$')
+
+
+class TestLoadTest(LiveServerTestCase):
+    def test_loadtest_classroom(self):
+        call_command('seed_synthetic', courses=1, worksheets=1, problems=2,
+            lessons=1, resources=0, stdout=StringIO())
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'loadtest.json')
+            call_command('loadtest_classroom', url=self.live_server_url, students=1,
+                output=output, stdout=StringIO())
+            with open(output) as f:
+                report = json.load(f)
+        # worksheets, randomize, 2 x check, check-results, reset
+        self.assertEqual(report['requests'], 6)
+        self.assertEqual(report['errors'], 0)
+        # The answers to the randomized problems.
+        self.assertEqual(report['correct_answers'], 2)
+        self.assertEqual(report['tables_after']['sessions'] - report['tables_before']['sessions'], 1)
@@ -0,0 +1,93 @@
+import numpy as np
+
+from django.test import SimpleTestCase
+
+from courses.forms import WorksheetProblemForm
+from courses.maths import ( ExpressionError, compile_answer,
+    evaluate_user_answer, sin, sin_array, sqrt )
+
+
+class TestCompileAnswer(SimpleTestCase):
+    def test_compiled_once(self):
+        self.assertIs(compile_answer('$x + ${y}'), compile_answer('$x + ${y}'))
+
+    def test_variables(self):
+        compiled = compile_answer('$x * ${y} + $x')
+        self.assertEqual(compiled.variables, frozenset({'x', 'y'}))
+        self.assertEqual(compiled({'x': 2, 'y': 20}), 42)
+        self.assertEqual(compiled({'x': 1.5, 'y': 2.0}), 4.5)
+
+    def test_functions(self):
+        self.assertEqual(compile_answer('sin($theta)')({'theta': 30}), sin(30))
+        self.assertEqual(compile_answer('sqrt(2) ** 2')(), sqrt(2) ** 2)
+
+    def test_evaluate_array(self):
+        compiled = compile_answer('$x * sin(${theta}) + 1')
+        x, theta = np.array([1.0, 2.0, 3.0]), np.array([0.0, 30.0, 90.0])
+        answers = compiled.evaluate_array({'x': x, 'theta': theta}, 3)
+        for i in range(3):
+            self.assertAlmostEqual(answers[i], compiled({'x': x[i], 'theta': theta[i]}))
+        self.assertEqual(list(compile_answer('42').evaluate_array({}, 2)), [42, 42])
+        self.assertEqual(list(sin_array([0, 30])), [sin(0), sin(30)])
+
+    def test_variable_named_like_a_function(self):
+        self.assertEqual(compile_answer('sqrt($sqrt)')({'sqrt': 4}), 2)
+
+    def test_undefined_variable(self):
+        with self.assertRaises(ExpressionError):
+            compile_answer('$x + $y')({'x': 1})
+
+    def test_rejected_expressions(self):
+        for expression in [
+            '__import__("os")',
+            '(1).real',
+            'abs(-1)',
+            '[1, 2]',
+            '"42"',
+            'lambda: 1',
+            '$x(2)',
+            '1 +',
+        ]:
+            with self.assertRaises(ExpressionError, msg=expression):
+                compile_answer(expression)
+
+
+class TestEvaluateUserAnswer(SimpleTestCase):
+    def test_numbers_and_expressions(self):
+        self.assertEqual(evaluate_user_answer('42'), 42)
+        self.assertEqual(evaluate_user_answer(' 4.2e1 '), 42.0)
+        self.assertEqual(evaluate_user_answer('-(6 * 7) + 2**3'), -34)
+        self.assertEqual(evaluate_user_answer('sin(30)'), sin(30))
+
+    def test_hostile_input_is_rejected(self):
+        for expression in [
+            '9**9**9**9',
+            '10**10**10',
+            '2**1025',
+            '1e308 * 10',
+            '1 / 0',
+            'sqrt(-1)',
+            '(-8) ** 0.5',
+            '+'.join(['1'] * 60),
+            '1' * 101,
+            '__import__("os")',
+            '$x + 1',
+        ]:
+            with self.assertRaises(ExpressionError, msg=expression):
+                evaluate_user_answer(expression)
+
+    def test_large_numbers_that_fit_in_a_float(self):
+        self.assertEqual(evaluate_user_answer('10**300'), 10**300)
+        self.assertEqual(evaluate_user_answer('2**1023'), 2**1023)
+        self.assertEqual(evaluate_user_answer('1e300'), 1e300)
+        self.assertEqual(evaluate_user_answer('2**-2000'), 0.0)
+        for expression in ['2**1024', '10**309', '10**308 * 10', '2.0**1024']:
+            with self.assertRaises(ExpressionError, msg=expression):
+                evaluate_user_answer(expression)
+
+    def test_form_cleans_to_rounded_number(self):
+        form = WorksheetProblemForm({'user_answer': '40 + 2.0001'})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['user_answer'], 42.0)
+        form = WorksheetProblemForm({'user_answer': '9**9**9**9'})
+        self.assertFalse(form.is_valid())
@@ -0,0 +1,112 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.shortcuts import reverse
+from django.test import TestCase, override_settings
+
+from courses import metrics
+from courses.tests.fixtures import SumWorksheetMixin
+from users.models import CustomUser
+
+
+def parse(text: str) -> dict:
+    """{ sample with labels: value } of the Prometheus text format."""
+    return { sample: float(value)
+        for sample, value in re.findall(r'^([^#\s]\S*) (\S+)$', text, re.MULTILINE) }
+
+
+@override_settings(COURSES_METRICS_TOKEN='secret')
+class TestMetrics(SumWorksheetMixin, TestCase):
+    course_name = 'Test Metrics'
+
+    def setUp(self):
+        super().setUp()
+        self.metrics_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(COURSES_METRICS_DIR=self.metrics_dir)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.metrics_dir)
+
+    def scrape(self) -> dict:
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        return parse(response.content.decode())
+
+    def check(self, answer: str) -> None:
+        self.client.post(
+            reverse('courses:worksheets-check', kwargs={'problem_id': self.problem.pk}),
+            {'user_answer': answer},
+        )
+
+    def test_protected(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, 403)
+        staff = CustomUser.objects.create_user(
+            username='staff', password='password', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+    def test_metrics(self):
+        before = self.scrape()
+        self.client.get(self.worksheet_url)
+        self.check('3')
+        self.check('4')
+        self.check('not a number')
+        after = self.scrape()
+        delta = lambda sample: after.get(sample, 0) - before.get(sample, 0)
+        for result in ('correct', 'incorrect', 'invalid'):
+            self.assertEqual(delta('courses_answer_checks_total{{result="{}"}}'.format(result)), 1)
+        self.assertEqual(delta('courses_request_seconds_count{url_name="courses:worksheets"}'), 1)
+        self.assertEqual(delta('courses_request_seconds_count{url_name="courses:worksheets-check"}'), 3)
+        self.assertEqual(
+            delta('courses_request_seconds_bucket{url_name="courses:worksheets-check",le="+Inf"}'), 3)
+        self.assertGreater(delta('courses_eval_seconds_count'), 0)
+        self.assertGreater(delta('courses_session_bytes_count'), 0)
+        self.assertGreater(sum( delta(sample) for sample in after
+            if sample.startswith('courses_cache_requests_total{cache="markdown"') ), 0)
+
+    def test_processes_are_added_up(self):
+        before = self.scrape()
+        # The file of another worker process, with 2 evaluations of 0.3 s.
+        with open(os.path.join(self.metrics_dir, 'metrics-1.json'), 'w') as f:
+            json.dump({
+                'courses_answer_checks_total': [[['correct'], 5]],
+                'courses_eval_seconds': [[[], [0] * 9 + [2, 0, 0.6]]],
+            }, f)
+        after = self.scrape()
+        delta = lambda sample: after.get(sample, 0) - before.get(sample, 0)
+        self.assertEqual(delta('courses_answer_checks_total{result="correct"}'), 5)
+        self.assertEqual(delta('courses_eval_seconds_count'), 2)
+        self.assertEqual(delta('courses_eval_seconds_bucket{le="0.1"}'), 0)
+        self.assertEqual(delta('courses_eval_seconds_bucket{le="0.5"}'), 2)
+        self.assertAlmostEqual(delta('courses_eval_seconds_sum'), 0.6)
+
+    def test_stopped_processes_are_retired(self):
+        before = self.scrape()
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+        path = os.path.join(self.metrics_dir, 'metrics-{}.json'.format(process.pid))
+        with open(path, 'w') as f:
+            json.dump({'courses_answer_checks_total': [[['correct'], 5]]}, f)
+        left_over = '{}.tmp'.format(path)
+        open(left_over, 'w').close()
+        an_hour_ago = time.time() - 60 * 60
+        os.utime(left_over, (an_hour_ago, an_hour_ago))
+        sample = 'courses_answer_checks_total{result="correct"}'
+        with self.settings(COURSES_METRICS_RETENTION=2 * 60 * 60):
+            self.assertEqual(self.scrape()[sample] - before.get(sample, 0), 5)
+        # Taken over by this process, the counter does not go down.
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(left_over))
+        with self.settings(COURSES_METRICS_RETENTION=30 * 60):
+            self.assertEqual(self.scrape()[sample] - before.get(sample, 0), 5)
+        self.assertFalse(os.path.exists(left_over))
@@ -73,6 +73,23 @@ class TestResource(TestCase):
     def test_resources_created(self):
         self.assertEqual(Resource.objects.count(), len(Resource.CATEGORY_CHOICES))
 
+    def test_course_resources(self):
+        course = Course.objects.create(name='Test', school='HS', nen=1, kumi='1')
+        for category, label in Resource.CATEGORY_CHOICES[:2]:
+            for i in range(0, 3):
+                Resource.objects.create(category=category).courses.add(course)
+        with self.assertNumQueries(1):
+            resources = course.resources
+        self.assertEqual(
+            list(resources),
+            [ label for category, label in Resource.CATEGORY_CHOICES ],
+        )
+        for category, label in Resource.CATEGORY_CHOICES:
+            self.assertEqual(
+                resources[label],
+                list(course.resource_set.filter(category=category).order_by('pk')),
+            )
+
 class TestWorksheet(TestCase):
     num_ws = 2
     problems_per_ws = 5
@@ -0,0 +1,39 @@
+import numpy as np
+
+from django.test import SimpleTestCase
+
+from courses.numformat import ( sn_round, sn_round_array, sn_round_str,
+    sn_round_str_array )
+
+
+class TestNumformat(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.numbers = np.concatenate([
+            rng.uniform(-1000, 1000, 2000),
+            10 ** rng.uniform(-30, 30, 2000),
+            rng.integers(-10**6, 10**6, 1000).astype(float),
+            [0.0, -0.0, 1.125, 0.125, 999.5, 9995, 1e5, 1e-5, 1e-300, 1e300],
+        ]).tolist()
+
+    def test_sn_round(self):
+        for number in self.numbers:
+            self.assertEqual(sn_round(number), float('{:.2e}'.format(number)))
+        self.assertEqual(sn_round(42), 42.0)
+        self.assertEqual(sn_round(123456), 123000.0)
+        self.assertEqual(sn_round(0.000123456), 0.000123)
+
+    def test_sn_round_array(self):
+        self.assertEqual(
+            sn_round_array(self.numbers).tolist(),
+            [ sn_round(number) for number in self.numbers ],
+        )
+
+    def test_sn_round_str(self):
+        self.assertEqual(sn_round_str(1.5), '1.5')
+        self.assertEqual(sn_round_str(123456), '1.23 \\times 10^{5}')
+        self.assertEqual(sn_round_str(0.00000123), '1.23 \\times 10^{-06}')
+        self.assertEqual(
+            sn_round_str_array([1.5, 123456]),
+            ['1.5', '1.23 \\times 10^{5}'],
+        )
@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+
+from django.shortcuts import reverse
+from django.test import TestCase, override_settings
+
+from courses.profiling import _tracemalloc_lock, list_captures
+from courses.tests.fixtures import SumWorksheetMixin
+from users.models import CustomUser
+
+
+class TestProfiling(SumWorksheetMixin, TestCase):
+    course_name = 'Test Profiling'
+
+    def setUp(self):
+        super().setUp()
+        self.profile_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            COURSES_PROFILE_DIR=self.profile_dir,
+            COURSES_PROFILE_KEEP=2,
+        )
+        self.settings_override.enable()
+        self.staff = CustomUser.objects.create_user(
+            username='staff', password='password', is_staff=True)
+        self.student = CustomUser.objects.create_user(
+            username='student', password='password')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.profile_dir)
+
+    def test_only_staff(self):
+        response = self.client.get(self.worksheet_url, {'profile': ''})
+        self.assertFalse(response.has_header('X-Profile-Capture'))
+        self.client.force_login(self.student)
+        response = self.client.get(self.worksheet_url, {'profile': ''})
+        self.assertFalse(response.has_header('X-Profile-Capture'))
+        self.assertEqual(list_captures(), [])
+        self.assertEqual(self.client.get(reverse('admin-profiles')).status_code, 302)
+
+    def test_capture(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(self.worksheet_url)
+        self.assertFalse(response.has_header('X-Profile-Capture'))
+        response = self.client.get(self.worksheet_url, {'profile': ''})
+        self.assertEqual(response.status_code, 200)
+        name = response['X-Profile-Capture']
+        self.assertEqual(
+            sorted(os.listdir(self.profile_dir)),
+            ['{}.{}'.format(name, extension) for extension in ('json', 'prof', 'txt')],
+        )
+        [capture] = list_captures()
+        self.assertEqual(capture['url_name'], 'courses:worksheets')
+        self.assertEqual(capture['user'], 'staff')
+        # The admin links to the captures, lists them and serves their files.
+        self.assertContains(self.client.get(reverse('admin:index')), reverse('admin-profiles'))
+        response = self.client.get(reverse('admin-profiles'))
+        self.assertContains(response, reverse('admin-profile-file',
+            kwargs={'name': name, 'extension': 'prof'}))
+        response = self.client.get(reverse('admin-profile-file',
+            kwargs={'name': name, 'extension': 'txt'}))
+        self.assertIn(b'Top 25 allocation sites', b''.join(response.streaming_content))
+        response = self.client.get(reverse('admin-profile-file',
+            kwargs={'name': '..', 'extension': 'txt'}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_concurrent_capture(self):
+        self.client.force_login(self.staff)
+        # Another request is tracing the allocations.
+        with _tracemalloc_lock:
+            response = self.client.get(self.worksheet_url, {'profile': ''})
+        self.assertEqual(response.status_code, 200)
+        [capture] = list_captures()
+        self.assertIsNone(capture['peak_kib'])
+        self.assertFalse(_tracemalloc_lock.locked())
+        response = self.client.get(self.worksheet_url, {'profile': ''})
+        self.assertIsNotNone(list_captures()[0]['peak_kib'])
+        self.assertFalse(_tracemalloc_lock.locked())
+
+    def test_directory_not_writable(self):
+        self.client.force_login(self.staff)
+        # A file where the directory should be.
+        path = os.path.join(self.profile_dir, 'not a directory')
+        open(path, 'w').close()
+        with self.settings(COURSES_PROFILE_DIR=path), \
+                self.assertLogs('courses.profiling', 'WARNING'):
+            response = self.client.get(self.worksheet_url, {'profile': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('X-Profile-Capture'))
+
+    def test_rotation(self):
+        self.client.force_login(self.staff)
+        names = [ self.client.get(self.worksheet_url, HTTP_X_PROFILE='1')['X-Profile-Capture']
+            for i in range(0, 3) ]
+        self.assertEqual(len(list_captures()), 2)
+        self.assertEqual(len(os.listdir(self.profile_dir)), 6)
+        self.assertNotIn(names[0], [ capture['name'] for capture in list_captures() ])
@@ -0,0 +1,101 @@
+from string import Template
+
+from markdown import markdown
+
+from django.core.cache import caches
+from django.test import TestCase
+
+from courses.models import Problem
+from courses.rendering import ( MARKDOWN_CACHE, compile_markdown_template,
+    markdown_cache_key, render_markdown, substitute_segments )
+
+
+class TestRenderMarkdown(TestCase):
+    def setUp(self):
+        caches[MARKDOWN_CACHE].clear()
+
+    def test_render(self):
+        self.assertEqual(render_markdown('*$x*', {'x': '1.0'}), '<p><em>1.0</em></p>')
+        self.assertEqual(render_markdown('Costs $$5'), '<p>Costs $$5</p>')
+
+    def test_render_unknown_and_escaped_placeholders(self):
+        self.assertEqual(
+            render_markdown('$x and ${y} cost $$5', {'x': '1.0'}),
+            '<p>1.0 and ${y} cost $5</p>',
+        )
+
+    def test_cache_key(self):
+        self.assertEqual(markdown_cache_key('$x'), markdown_cache_key('$x'))
+        self.assertNotEqual(markdown_cache_key('$x'), markdown_cache_key('$y'))
+        self.assertNotEqual(
+            markdown_cache_key('$x'),
+            markdown_cache_key('$x', kind='template'),
+        )
+
+    def test_segments(self):
+        segments = compile_markdown_template('# $x\n\n*y is ${y}.*')
+        self.assertEqual(
+            segments,
+            ('<h1>', ('x', '$x'), '</h1>\n<p><em>y is ', ('y', '${y}'), '.</em></p>'),
+        )
+        self.assertEqual(
+            substitute_segments(segments, {'x': '1.0', 'y': '2.0'}),
+            '<h1>1.0</h1>\n<p><em>y is 2.0.</em></p>',
+        )
+        self.assertIsNone(compile_markdown_template('kgisteamslot0x'))
+        self.assertEqual(
+            render_markdown('kgisteamslot0x $x', {'x': '1.0'}),
+            '<p>kgisteamslot0x 1.0</p>',
+        )
+
+    def test_placeholder_starts_a_block(self):
+        for text in ('$n. apples', '  ${n}. apples', '> $n. apples', 'Count:\n\n$n. apples'):
+            self.assertIsNone(compile_markdown_template(text))
+            for n in (5, 'five'):
+                self.assertEqual(
+                    render_markdown(text, {'n': n}),
+                    markdown(Template(text).safe_substitute(n=n)),
+                )
+        self.assertEqual(render_markdown('$n. apples', {'n': 5}), '<ol>\n<li>apples</li>\n</ol>')
+
+    def test_placeholder_next_to_markdown(self):
+        for text in ('x*$n*y', '\\$n', '`$n`', '_${n}_', '[link]($n)', '<$n>', '&$n;'):
+            self.assertIsNone(compile_markdown_template(text), msg=text)
+            for n in (5, -5, '1.23 \\times 10^{5}', '<b>'):
+                self.assertEqual(
+                    render_markdown(text, {'n': n}),
+                    markdown(Template(text).safe_substitute(n=n)),
+                    msg=text,
+                )
+
+    def test_plain_placeholders_are_compiled(self):
+        for text in ('The mass is $m kg.', '($m, ${F}N)', '| $m | 2 |', '\\( \\frac{$F}{$m} \\)',
+                '**Given** $m and $F', 'a=$m; b=-$F!'):
+            self.assertIsNotNone(compile_markdown_template(text), msg=text)
+            for m, F in ((5, -2.5), ('1.23 \\times 10^{5}', '4.56 \\times 10^{-7}')):
+                self.assertEqual(
+                    render_markdown(text, {'m': m, 'F': F}),
+                    markdown(Template(text).safe_substitute(m=m, F=F)),
+                    msg=text,
+                )
+
+    def test_cached(self):
+        key = markdown_cache_key('# Title')
+        self.assertIsNone(caches[MARKDOWN_CACHE].get(key))
+        html = render_markdown('# Title')
+        self.assertEqual(caches[MARKDOWN_CACHE].get(key), html)
+
+    def test_rendered_on_save(self):
+        problem = Problem.objects.create(
+            question='What is $x + ${y}?',
+            variables_with_values='x[40], y[2]',
+            answer='$x + ${y}',
+            solution='$x + $y = $calculated_answer',
+        )
+        cache = caches[MARKDOWN_CACHE]
+        self.assertEqual(
+            cache.get(markdown_cache_key(problem.question, kind='template')),
+            ('<p>What is ', ('x', '$x'), ' + ', ('y', '${y}'), '?</p>'),
+        )
+        self.assertEqual(problem.question_markdown, '<p>What is 40.0 + 2.0?</p>')
+        self.assertEqual(problem.solution_markdown_released, '<p>40.0 + 2.0 = 42.0</p>')
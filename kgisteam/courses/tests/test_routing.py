@@ -0,0 +1,81 @@
+from django.core.signals import request_started
+from django.test import TestCase
+from django.utils import timezone
+
+from courses.models import Course, Lesson, Syllabus, Worksheet
+from courses import routing
+from courses.routing import course_worksheets, find_course
+
+
+class TestRouting(TestCase):
+    def setUp(self):
+        self.course = Course.objects.create(
+            year=timezone.now().year,
+            name='Test Routing',
+            school='HS',
+            nen=2,
+            kumi='3',
+        )
+        self.worksheet = Worksheet.objects.create(title='Routing 1')
+        self.course.worksheet_set.add(self.worksheet)
+        self.key = (self.course.year, 'HS', 'Test Routing', '2-3')
+
+    def test_lookups_do_not_query(self):
+        find_course(*self.key)
+        with self.assertNumQueries(0):
+            course = find_course(*self.key)
+            worksheets = course_worksheets(course)
+        self.assertEqual(course, self.course)
+        self.assertEqual(course.nen_kumi, self.course.nen_kumi)
+        self.assertEqual(worksheets, [ self.worksheet ])
+        self.assertIsNone(find_course(self.course.year, 'HS', 'Test Routing', '2-4'))
+
+    def test_changes_are_seen(self):
+        course = find_course(*self.key)
+        self.course.kumi = '4'
+        self.course.save()
+        self.assertIsNone(find_course(*self.key))
+        course = find_course(self.course.year, 'HS', 'Test Routing', '2-4')
+        self.assertEqual(course, self.course)
+        # Worksheets that are renamed, added or removed.
+        self.worksheet.title = 'Routing 1 renamed'
+        self.worksheet.save()
+        self.assertEqual(course_worksheets(course)[0].title, 'Routing 1 renamed')
+        other_worksheet = Worksheet.objects.create(title='Routing 2')
+        other_worksheet.course.add(course)
+        self.assertEqual(course_worksheets(course), [ self.worksheet, other_worksheet ])
+        self.worksheet.delete()
+        self.assertEqual(course_worksheets(course), [ other_worksheet ])
+        course.worksheet_set.clear()
+        self.assertEqual(course_worksheets(course), [])
+
+    def test_changes_by_other_processes_are_seen(self):
+        """Changes without signals, like those made by another process."""
+        course = find_course(*self.key)
+        Course.objects.filter(pk=self.course.pk).update(
+            kumi='4', nen_kumi='2-4', last_modified=timezone.now())
+        request_started.send(sender=None)
+        self.assertIsNone(find_course(*self.key))
+        course = find_course(self.course.year, 'HS', 'Test Routing', '2-4')
+        self.assertEqual(course, self.course)
+        [other_worksheet] = Worksheet.objects.bulk_create([ Worksheet(title='Routing 2') ])
+        other_worksheet = Worksheet.objects.get(title='Routing 2')
+        Worksheet.course.through.objects.bulk_create([
+            Worksheet.course.through(course_id=course.pk, worksheet_id=other_worksheet.pk),
+        ])
+        request_started.send(sender=None)
+        self.assertEqual(course_worksheets(course), [ self.worksheet, other_worksheet ])
+        Worksheet.course.through.objects.filter(worksheet_id=self.worksheet.pk)._raw_delete(
+            Worksheet.course.through.objects.db)
+        request_started.send(sender=None)
+        self.assertEqual(course_worksheets(course), [ other_worksheet ])
+
+    def test_other_changes_keep_the_index(self):
+        find_course(*self.key)
+        index = routing._index
+        syllabus = Syllabus.objects.create(course=self.course)
+        Lesson.objects.bulk_create([ Lesson(syllabus=syllabus, number=1) ])
+        request_started.send(sender=None)
+        with self.assertNumQueries(1):
+            self.assertEqual(find_course(*self.key), self.course)
+        self.assertIs(routing._index, index)
@@ -0,0 +1,57 @@
+from unittest import mock
+
+from django.shortcuts import reverse
+from django.test import TestCase
+from django.utils import timezone
+
+from courses import sitemaps
+from courses.models import Course, Syllabus, Worksheet
+from courses.viewaids import kwargs_from_course_and_worksheet
+
+
+class TestSitemap(TestCase):
+    def setUp(self):
+        self.courses = list()
+        for kumi in 'ABC':
+            course = Course.objects.create(
+                year=timezone.now().year,
+                name='Test Sitemap',
+                school='MS',
+                nen=1,
+                kumi=kumi,
+            )
+            Syllabus.objects.create(course=course)
+            for i in range(0, 2):
+                worksheet = Worksheet.objects.create(title='Sitemap {} {}'.format(kumi, i))
+                course.worksheet_set.add(worksheet)
+            self.courses.append(Course.objects.get(pk=course.pk))
+        self.url = reverse('django.contrib.sitemaps.views.sitemap')
+
+    def test_sitemap(self):
+        # The version of the content and one query per section.
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Robots-Tag'], 'noindex, noodp, noarchive')
+        for course in self.courses:
+            self.assertContains(response, course.syllabus.get_absolute_url())
+            for worksheet in course.worksheet_set.all():
+                self.assertContains(response, reverse(
+                    'courses:worksheets',
+                    kwargs=kwargs_from_course_and_worksheet(course, worksheet),
+                ))
+        # Cached until the version of the content changes.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url).content, response.content)
+        worksheet = Worksheet.objects.create(title='Sitemap new')
+        worksheet.course.add(self.courses[0])
+        self.assertContains(self.client.get(self.url), 'Sitemap%20new')
+
+    def test_sitemap_index(self):
+        with mock.patch.object(sitemaps, 'MAX_SITEMAP_URLS', 4), \
+                mock.patch.object(sitemaps.PrecomputedSitemap, 'limit', 4):
+            response = self.client.get(self.url)
+            self.assertContains(response, '<sitemapindex')
+            section_url = reverse('sitemap-section', kwargs={'section': 'worksheets'})
+            self.assertContains(response, '{}?p=2'.format(section_url))
+            response = self.client.get(section_url, {'p': 2})
+        self.assertEqual(response.content.count(b'<url>'), 2)
@@ -1,3 +1,5 @@
+from unittest.mock import patch
+
 from django.test import TestCase
 from django.utils import timezone
 
@@ -43,6 +45,19 @@ class TestTerms(TestCase):
             course = rewind_starts(course, i * self.term_timedelta)
             self.assertEqual(course.term_now, i + 1)
 
+    def test_course_term_now_is_shared(self):
+        course = Course.objects.get(id=1)
+        self.assertEqual(course.term_now, 1)
+        with self.assertNumQueries(1):
+            other = Course.objects.get(id=1)
+        with patch('courses.models.bisect_right') as bisect:
+            self.assertEqual(other.term_now, 1)
+        bisect.assert_not_called()
+        # New start dates are not answered from the cache.
+        other.term1_start -= self.term_timedelta
+        other.term2_start -= self.term_timedelta
+        self.assertEqual(other.term_now, 2)
+
     def test_course_term_type(self):
         course = Course.objects.get(id=1)
         course.term1_start = ''
@@ -67,3 +82,20 @@ class TestTerms(TestCase):
             for lesson in lessons[2*i:2*i+2]:
                 lesson.date += i*self.term_timedelta
                 self.assertEqual(lesson.term_num, i+1)
+
+    def test_lessons_in_term(self):
+        syllabus = Syllabus.objects.get(course_id=1)
+        lessons = list(Lesson.objects.all())
+        for i, lesson in enumerate(lessons):
+            lesson.date += (i % 5 - 1) * self.term_timedelta
+            lesson.save()
+        course = syllabus.course
+        for term in range(1, 5):
+            with self.assertNumQueries(1):
+                lessons_in_term = list(syllabus.lessons_in_term(term))
+            self.assertEqual(
+                lessons_in_term,
+                [ lesson for lesson in lessons if course.term_of(lesson.date) == term ],
+            )
+            self.assertTrue(lessons_in_term)
+        self.assertEqual(list(syllabus.lessons_in_term(5)), [])
@@ -0,0 +1,89 @@
+from io import BytesIO
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from PIL import Image
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.shortcuts import reverse
+from django.test import TestCase, override_settings
+
+from courses.models import Course
+from courses.thumbnails import ( THUMBNAIL_DIR, THUMBNAILS_FAILED, make_thumbnails,
+    update_course_thumbnails )
+
+
+def image_file(width: int, height: int, color: str = 'red', mode: str = 'RGB') -> ContentFile:
+    output = BytesIO()
+    Image.new(mode, (width, height), color).save(output, 'PNG' if mode == 'RGBA' else 'JPEG')
+    return ContentFile(output.getvalue())
+
+
+class TestThumbnails(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.course = Course(name='Test Thumbnails', school='HS', nen=1, kumi='1')
+        self.course.image_path.save('course.jpg', image_file(1200, 800), save=False)
+        self.course.save()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def thumbnail_files(self) -> list:
+        files = list()
+        for root, dirs, names in os.walk(os.path.join(self.media_root, THUMBNAIL_DIR)):
+            files.extend(names)
+        return sorted(files)
+
+    def test_make_thumbnails(self):
+        update_course_thumbnails(self.course.pk)
+        course = Course.objects.get(pk=self.course.pk)
+        thumbnails = course.thumbnails
+        self.assertEqual(thumbnails.widths, (320, 480, 640, 960))
+        self.assertEqual(thumbnails.extension, 'jpg')
+        self.assertEqual(len(self.thumbnail_files()), 8)
+        with default_storage.open(thumbnails.name(480, 'webp')) as f:
+            self.assertEqual(Image.open(f).size, (480, 320))
+        self.assertIn('-960w.webp 960w', thumbnails.webp_srcset)
+        response = self.client.get(reverse('courses:home'))
+        self.assertContains(response, thumbnails.srcset())
+        # The same image is not resized again, small images are not enlarged.
+        with self.course.image_path.open('rb') as f:
+            self.assertEqual(make_thumbnails(f.read()), thumbnails)
+        self.assertEqual(len(self.thumbnail_files()), 8)
+        small = make_thumbnails(image_file(200, 100, mode='RGBA', color=(0, 0, 0, 0)).read())
+        self.assertEqual(small.widths, (200,))
+        self.assertEqual(small.extension, 'png')
+
+    def test_replaced_image(self):
+        update_course_thumbnails(self.course.pk)
+        course = Course.objects.get(pk=self.course.pk)
+        self.assertTrue(course.thumbnails)
+        course.save()
+        self.assertTrue(Course.objects.get(pk=self.course.pk).thumbnails)
+        course.image_path.save('other.jpg', image_file(1200, 800, 'blue'), save=False)
+        course.save()
+        self.assertIsNone(Course.objects.get(pk=self.course.pk).thumbnails)
+
+    def test_broken_image(self):
+        self.course.image_path.save('broken.jpg', ContentFile(b'not an image'), save=False)
+        self.course.save()
+        with self.assertLogs('courses.thumbnails', 'ERROR'):
+            self.assertIsNone(update_course_thumbnails(self.course.pk))
+        course = Course.objects.get(pk=self.course.pk)
+        self.assertEqual(course.image_thumbnails, THUMBNAILS_FAILED)
+        self.assertIsNone(course.thumbnails)
+        self.assertEqual(self.client.get(reverse('courses:home')).status_code, 200)
+        # Saving does not try again, a new image does.
+        with mock.patch('courses.models.make_course_thumbnails_later') as later:
+            course.save()
+            later.assert_not_called()
+            course.image_path.save('other.jpg', image_file(1200, 800, 'blue'), save=False)
+            course.save()
+            later.assert_called_once_with(course.pk)
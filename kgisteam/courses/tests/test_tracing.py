@@ -0,0 +1,67 @@
+import json
+import os
+import tempfile
+from urllib.parse import unquote
+
+from django.shortcuts import reverse
+from django.test import TestCase, override_settings
+
+from courses.tests.fixtures import SumWorksheetMixin
+from courses.tracing import Trace, timed
+
+
+class TestTracing(SumWorksheetMixin, TestCase):
+    course_name = 'Test Tracing'
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.log = os.path.join(self.directory.name, 'traces.jsonl')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def spans(self, response) -> set:
+        return { entry.split(';')[0].strip()
+            for entry in response['Server-Timing'].split(',') }
+
+    def test_not_sampled(self):
+        with override_settings(COURSES_TRACE_SAMPLE_RATE=0, COURSES_TRACE_LOG=self.log):
+            response = self.client.get(self.worksheet_url)
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertFalse(os.path.exists(self.log))
+
+    def test_sampled(self):
+        with override_settings(COURSES_TRACE_SAMPLE_RATE=1, COURSES_TRACE_LOG=self.log):
+            page = self.client.get(self.worksheet_url)
+            check = self.client.post(
+                reverse('courses:worksheets-check', kwargs={'problem_id': self.problem.pk}),
+                {'user_answer': '3'},
+            )
+        self.assertLessEqual({'sql', 'template', 'markdown', 'total'}, self.spans(page))
+        self.assertLessEqual({'sql', 'session', 'eval', 'total'}, self.spans(check))
+        with open(self.log) as f:
+            records = [ json.loads(line) for line in f ]
+        self.assertEqual(
+            [ (record['url_name'], record['status']) for record in records ],
+            [('courses:worksheets', 200), ('courses:worksheets-check', 200)],
+        )
+        self.assertEqual(records[0]['path'], unquote(self.worksheet_url))
+        self.assertGreater(records[0]['spans']['sql']['count'], 0)
+
+    def test_log_not_writable(self):
+        log = os.path.join(self.directory.name, 'missing', 'traces.jsonl')
+        with override_settings(COURSES_TRACE_SAMPLE_RATE=1, COURSES_TRACE_LOG=log), \
+                self.assertLogs('courses.tracing', 'WARNING'):
+            response = self.client.get(self.worksheet_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.has_header('Server-Timing'))
+
+    def test_timed_without_trace(self):
+        with timed('nothing'):
+            pass
+        trace = Trace()
+        trace.add('sql', 1.5)
+        trace.add('sql', 0.5)
+        self.assertEqual(trace.server_timing(3),
+            'sql;dur=2.0;desc="2x", total;dur=3.0')
@@ -3,6 +3,7 @@ from django.utils import timezone
 
 from courses.maths import sn_round_str
 from courses.models import Course, Lesson, Problem, Resource, Syllabus, Worksheet
+from courses.variables import Variable, parse_variables, variables_spec_from_json
 
 
 class TestProblem(TestCase):
@@ -61,3 +62,47 @@ class TestProblem(TestCase):
             )
         self.assertIsInstance(randomized_vars['var1'], float)
         self.assertIsInstance(randomized_vars['var2'], int)
+
+    def test_vars_seeded(self):
+        problem = Problem.objects.get(id=1)
+        problem.variables_with_values = 'var1[1, -4, 6, 0], var2[2, -300, 700, 1]'
+        self.assertEqual(
+            problem.variables_randomized(seed=42),
+            problem.variables_randomized(seed=42),
+        )
+        self.assertNotEqual(
+            [ problem.variables_randomized(seed=seed) for seed in range(5) ],
+            [ problem.variables_randomized(seed=42) ] * 5,
+        )
+
+    def test_vars_array(self):
+        problem = Problem.objects.get(id=1)
+        problem.variables_with_values = 'var1[1, -4, 6, 0], var2[2, -3, 7, 1]'
+        self.assertEqual(problem.variable_names, ['var1', 'var2'])
+        values = problem.variables_randomized_array(100)
+        self.assertEqual(values.shape, (100, 2))
+        self.assertTrue(((-4 <= values[:, 0]) & (values[:, 0] <= 6)).all())
+        self.assertTrue((values[:, 1] == values[:, 1].round()).all())
+        answers = problem.calculate_answers(values)
+        for row, answer in zip(values, answers):
+            problem.use_variables(dict(zip(problem.variable_names, row)))
+            self.assertEqual(answer, problem.calculate_answer())
+
+    def test_vars_spec_saved(self):
+        problem = Problem.objects.get(id=1)
+        spec = variables_spec_from_json(problem.variables_spec)
+        self.assertEqual(spec, parse_variables('var1[1], var2[2]'))
+        self.assertEqual(spec.names, ['var1', 'var2'])
+        self.assertTrue(spec.has_variables)
+        self.assertFalse(spec.is_randomizable)
+        problem.variables_with_values = 'var1[1, 6], var2[2, -3, 7, 1]'
+        problem.save()
+        problem = Problem.objects.get(id=1)
+        self.assertEqual(
+            variables_spec_from_json(problem.variables_spec).variables,
+            (
+                Variable('var1', 1.0, 1.0, 6.0, False, 2),
+                Variable('var2', 2.0, -3.0, 7.0, True, 4),
+            ),
+        )
+        self.assertTrue(problem.is_randomizable)
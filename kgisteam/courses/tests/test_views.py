@@ -1,9 +1,19 @@
+import gzip
+import json
+
+from django.db import connection
 from django.shortcuts import reverse
 from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
-from courses.models import Course, Problem, Syllabus, Worksheet
+from courses.models import ( Course, Lesson, Problem, Syllabus, Worksheet,
+    WorksheetProgress )
 from courses.viewaids import kwargs_from_course, kwargs_from_course_and_worksheet
+from users.models import CustomUser
+
+# The most queries a worksheet page may take, including the session.
+WORKSHEET_PAGE_QUERY_BUDGET = 4
 
 
 class CoursesViewTest(TestCase):
@@ -39,6 +49,10 @@ class CoursesViewTest(TestCase):
             self.test_course,
             self.test_ws,
         ) 
+        self.results_url = '{}?worksheet={}'.format(
+            reverse('courses:worksheets-check-results'),
+            self.test_ws.id,
+        )
 
 
     def test_syllabus_view(self):
@@ -62,6 +76,25 @@ class CoursesViewTest(TestCase):
             response.redirect_chain[-1][0],
             reverse('courses:worksheets', kwargs=self.test_ws_kwargs),
         )
+        seed = self.client.session['randomized_worksheets'][str(self.test_ws.id)]
+        self.assertEqual(response.context['is_randomized'], 1)
+        # Answers for the values shown are checked against the same values.
+        problem = Problem.objects.get(id=self.test_ws.problem_set.first().id)
+        problem.variables_with_values = 'x[40, 0, 100], y[2, 0, 10]'
+        problem.save()
+        problem.use_variables(problem.variables_randomized(seed))
+        response = self.client.post(
+            reverse('courses:worksheets-check', kwargs={ 'problem_id': problem.id }),
+            { 'user_answer': problem.calculate_answer() },
+        )
+        self.assertEqual(response.json()['result'], 'correct')
+        # Randomizing again turns it off.
+        self.client.get(
+            reverse('courses:worksheets-randomize', kwargs=self.test_ws_kwargs)
+        )
+        self.assertNotIn(
+            str(self.test_ws.id), self.client.session['randomized_worksheets']
+        )
 
     def test_worksheet_view(self):
         response = self.client.get(
@@ -69,9 +102,56 @@ class CoursesViewTest(TestCase):
         )
         self.assertEqual(response.status_code, 200)
 
+    def test_worksheet_view_query_budget(self):
+        """The number of queries does not depend on the number of problems."""
+        query_counts = list()
+        for num_problems in (5, 60):
+            ws = Worksheet.objects.create(title='Budget {}'.format(num_problems))
+            self.test_course.worksheet_set.add(ws)
+            for i in range(0, num_problems):
+                ws.problem_set.add(Problem.objects.create(
+                    question='What is the sum of $x and ${y}?',
+                    variables_with_values='x[40, 0, 100], y[2]',
+                    answer='$x + ${y}',
+                    solution='$x + ${y} = $calculated_answer',
+                ))
+            kwargs = kwargs_from_course_and_worksheet(self.test_course, ws)
+            # Randomize, so the problems are fetched with their variables.
+            self.client.get(reverse('courses:worksheets-randomize', kwargs=kwargs))
+            # The first shuffle stores its seed in the session.
+            self.client.get(reverse('courses:worksheets', kwargs=dict(kwargs, order='random')))
+            for order in ('ordered', 'random'):
+                kwargs['order'] = order
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(reverse('courses:worksheets', kwargs=kwargs))
+                self.assertEqual(len(response.context['active_problems']), num_problems)
+                query_counts.append(len(queries))
+        self.assertEqual(len(set(query_counts)), 1)
+        self.assertLessEqual(query_counts[0], WORKSHEET_PAGE_QUERY_BUDGET)
+
+    def test_worksheet_shuffle(self):
+        kwargs = dict(self.test_ws_kwargs, order='random')
+        url = reverse('courses:worksheets', kwargs=kwargs)
+        problems = self.test_ws.problem_set.all()
+        for i in range(0, 10):
+            Problem.objects.create(worksheet=self.test_ws, answer='42')
+        orders = [
+            [ problem.pk for problem in self.client.get(url).context['active_problems'] ]
+            for i in range(0, 3)
+        ]
+        # The order is stable across reloads, and the same problems.
+        self.assertEqual(orders[0], orders[1])
+        self.assertEqual(orders[0], orders[2])
+        self.assertEqual(sorted(orders[0]), [ problem.pk for problem in problems ])
+        self.assertNotEqual(orders[0], sorted(orders[0]))
+        # Resetting the worksheet gives a new order next time.
+        seed = self.client.session['shuffled_worksheets'][str(self.test_ws.id)]
+        self.client.get(reverse('courses:worksheets-reset', kwargs=kwargs))
+        self.assertNotIn(str(self.test_ws.id), self.client.session['shuffled_worksheets'])
+
     def test_worksheet_check_answers_view(self):
         problem = self.test_ws.problem_set.first()
-        response = self.client.get(reverse('courses:worksheets-check-results'))
+        response = self.client.get(self.results_url)
         # Test the check answers results view
         self.assertEqual(response.status_code, 200)
         # View with no POST returns a json response with result: 'invalid form'
@@ -101,6 +181,75 @@ class CoursesViewTest(TestCase):
         )
         self.assertEqual(dict(response.json())['result'], 'incorrect')
 
+    def test_worksheet_check_all_answers_view(self):
+        problems = list(self.test_ws.problem_set.all())
+        url = reverse(
+            'courses:worksheets-check-all',
+            kwargs={ 'worksheet_id': self.test_ws.id }
+        )
+        answers = [
+            [problems[0].id, '40 + 2'],
+            [problems[1].id, '41'],
+            [problems[1].id + 1000, '42'],
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, json.dumps(answers), content_type='application/json')
+        # One query for the problems, the rest are for the session and progress.
+        self.assertEqual(
+            len([ query for query in queries if 'courses_problem' in query['sql'] ]),
+            1,
+        )
+        self.assertEqual(
+            [ (result['primary-key'], result['result']) for result in response.json()['results'] ],
+            [(problems[0].id, 'correct'), (problems[1].id, 'incorrect')],
+        )
+        response = self.client.get(self.results_url)
+        self.assertEqual(response.json()['checked_problems_correct'], [problems[0].id])
+        self.assertEqual(response.json()['checked_problems_incorrect'], [problems[1].id])
+        # Malformed requests
+        response = self.client.post(url, 'not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, json.dumps([[problems[0].id, '1']] * 201), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, '[[1e400, 1]]', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        # An unknown worksheet, and answers to no problem, save no progress.
+        progress = WorksheetProgress.objects.count()
+        response = self.client.post(
+            reverse('courses:worksheets-check-all', kwargs={ 'worksheet_id': 99999 }),
+            json.dumps(answers), content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 404)
+        other = Worksheet.objects.exclude(pk=self.test_ws.pk).first()
+        response = self.client.post(
+            reverse('courses:worksheets-check-all', kwargs={ 'worksheet_id': other.pk }),
+            '[]', content_type='application/json',
+        )
+        self.assertEqual(response.json()['results'], [])
+        self.assertEqual(WorksheetProgress.objects.count(), progress)
+
+    def test_worksheet_progress_is_per_worksheet(self):
+        other_ws = Worksheet.objects.exclude(pk=self.test_ws.pk).first()
+        for ws in (self.test_ws, other_ws):
+            problem = ws.problem_set.first()
+            self.client.post(
+                reverse('courses:worksheets-check', kwargs={ 'problem_id': problem.id }),
+                { 'user_answer': problem.calculated_answer }
+            )
+        self.assertNotIn('checked_problems_correct', self.client.session)
+        self.assertEqual(WorksheetProgress.objects.count(), 2)
+        response = self.client.get(self.results_url)
+        self.assertEqual(
+            response.json()['checked_problems_correct'],
+            [self.test_ws.problem_set.first().id],
+        )
+        # Reset only clears the progress of the active worksheet.
+        self.client.get(reverse('courses:worksheets-reset', kwargs=self.test_ws_kwargs))
+        self.assertEqual(
+            list(WorksheetProgress.objects.values_list('worksheet', flat=True)),
+            [other_ws.id],
+        )
+
     def test_worksheet_reset_view(self):
         # Redirects back to the original worksheet.
         response = self.client.get(
@@ -129,7 +278,7 @@ class CoursesViewTest(TestCase):
         )
         # Check that the problems are cleared
         self.client.get(reverse('courses:worksheets-reset', kwargs=self.test_ws_kwargs))
-        response = self.client.get(reverse('courses:worksheets-check-results'))
+        response = self.client.get(self.results_url)
         for _ in self.test_ws.problem_set.all():
             self.assertNotIn(_.id, response.json()['checked_problems_correct'])
             self.assertNotIn(_.id, response.json()['checked_problems_incorrect'])
@@ -158,7 +307,7 @@ class CoursesViewTest(TestCase):
             response.redirect_chain[-1][0],
             reverse('courses:worksheets', kwargs=self.test_ws_kwargs),
         )
-        response = self.client.get(reverse('courses:worksheets-check-results'))
+        response = self.client.get(self.results_url)
         self.assertEqual(response.json(), {'checked_problems_correct': [], 'checked_problems_incorrect': []})
 
     def test_resource_view(self):
@@ -166,3 +315,71 @@ class CoursesViewTest(TestCase):
             reverse('courses:resources', kwargs=self.test_course_kwargs)
         )
         self.assertEqual(response.status_code, 200)
+
+    def test_public_page_cache(self):
+        kwargs = dict(self.test_course_kwargs, term=0)
+        url = reverse('courses:syllabus', kwargs=kwargs)
+        syllabus = Syllabus.objects.get(course=self.test_course)
+        lesson = Lesson.objects.create(syllabus=syllabus, number=1, topics='Topic A')
+        response = self.client.get(url)
+        self.assertContains(response, 'Topic A')
+        # Served from the cache, gzipped if the client accepts it. The only
+        # queries are for the version of the content (see courses.versions)
+        # and the validators (see courses.conditional).
+        with self.assertNumQueries(2):
+            cached_response = self.client.get(url)
+        self.assertEqual(cached_response.content, response.content)
+        gzip_response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(gzip_response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(gzip_response.content), response.content)
+        # Editing the syllabus makes the cached page stale.
+        lesson.topics = 'Topic B'
+        lesson.save()
+        self.assertContains(self.client.get(url), 'Topic B')
+        # So does an edit by another process, which sends no signals here.
+        Lesson.objects.filter(pk=lesson.pk).update(
+            topics='Topic C', last_modified=timezone.now())
+        self.assertContains(self.client.get(url), 'Topic C')
+        # Logged in users are not served from the cache.
+        user = CustomUser.objects.create_user(username='test.user', password='NotPassword123')
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertTrue(any('courses_lesson' in query['sql'] for query in queries))
+
+    def test_conditional_get(self):
+        syllabus_url = reverse('courses:syllabus', kwargs=dict(self.test_course_kwargs, term=0))
+        # url: the number of queries for a 304, including the version of
+        # the content, see courses.versions
+        urls = {
+            syllabus_url: 2,
+            reverse('courses:resources', kwargs=self.test_course_kwargs): 2,
+            reverse('courses:worksheets', kwargs=self.test_ws_kwargs): 2,
+            reverse('django.contrib.sitemaps.views.sitemap'): 1,
+        }
+        for url, num_queries in urls.items():
+            # The first visit to a worksheet sets the csrf cookie.
+            self.client.get(url)
+            response = self.client.get(url)
+            self.assertTrue(response.has_header('ETag'))
+            self.assertTrue(response.has_header('Last-Modified'))
+            with self.assertNumQueries(num_queries):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+        # Changes make the validators stale.
+        response = self.client.get(syllabus_url)
+        Lesson.objects.create(syllabus=Syllabus.objects.get(course=self.test_course))
+        response = self.client.get(syllabus_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        # Also changes by another process, which sends no signals here.
+        for url in urls:
+            response = self.client.get(url)
+            Worksheet.objects.filter(pk=self.test_ws.pk).update(last_modified=timezone.now())
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 200)
+        # Randomized worksheets are always sent.
+        self.client.get(
+            reverse('courses:worksheets-randomize', kwargs=self.test_ws_kwargs)
+        )
+        response = self.client.get(reverse('courses:worksheets', kwargs=self.test_ws_kwargs))
+        self.assertFalse(response.has_header('ETag'))
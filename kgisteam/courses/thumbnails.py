@@ -0,0 +1,165 @@
+"""Thumbnails of the course images for the course cards.
+
+The uploaded course images are photos of several megabytes, and a card is at
+most a quarter of the screen wide. Each image is resized with Pillow to the
+THUMBNAIL_WIDTHS that are smaller than the original, in its own format and
+as WebP, and the cards choose one with srcset.
+
+Thumbnails are content addressed: they are named after a hash of the
+original image, so the same image uploaded for several courses is resized
+once, and a new image never shows a stale thumbnail. Resizing runs in a
+background thread after the course is saved. Until it is done, and for
+images that were uploaded before thumbnails existed (see the makethumbnails
+command), the cards show the original image. So do the cards of images that
+cannot be resized, the error is logged and the course is marked with
+THUMBNAILS_FAILED so that saving it does not try again.
+"""
+from collections import namedtuple
+from io import BytesIO
+import hashlib
+import json
+import logging
+import threading
+
+from PIL import Image, ImageOps
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_WIDTHS = (320, 480, 640, 960)
+THUMBNAIL_DIR = 'courses/thumbnails'
+# The width of the thumbnail in src, for browsers without srcset.
+DEFAULT_WIDTH = 640
+# Matches the course card columns in courses/home.html.
+THUMBNAIL_SIZES = '(max-width: 768px) 100vw, 25vw'
+# Course.image_thumbnails of an image that could not be resized.
+THUMBNAILS_FAILED = 'failed'
+_FORMATS = {
+    # extension: (PIL format, save options)
+    'jpg': ('JPEG', { 'quality': 82, 'optimize': True, 'progressive': True }),
+    'png': ('PNG', { 'optimize': True }),
+    'webp': ('WEBP', { 'quality': 80 }),
+}
+
+
+class Thumbnails(namedtuple('Thumbnails', ['digest', 'widths', 'extension'])):
+    """The thumbnails that were made for an image.
+
+    extension is the format of the fallback thumbnails, 'jpg' or 'png' for
+    images with transparency. There are always WebP thumbnails as well.
+    """
+    __slots__ = ()
+
+    def name(self, width: int, extension: str) -> str:
+        return thumbnail_name(self.digest, width, extension)
+
+    def url(self, width: int = DEFAULT_WIDTH, extension: str = None) -> str:
+        """The thumbnail closest to width."""
+        width = min(self.widths, key=lambda w: abs(w - width))
+        return default_storage.url(self.name(width, extension or self.extension))
+
+    def srcset(self, extension: str = None) -> str:
+        return ', '.join(
+            '{} {}w'.format(default_storage.url(self.name(width, extension or self.extension)), width)
+            for width in self.widths
+        )
+
+    @property
+    def webp_srcset(self) -> str:
+        return self.srcset('webp')
+
+    @property
+    def sizes(self) -> str:
+        return THUMBNAIL_SIZES
+
+    def to_json(self) -> str:
+        return json.dumps(list(self), separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, thumbnails: str) -> 'Thumbnails':
+        digest, widths, extension = json.loads(thumbnails)
+        return cls(digest, tuple(widths), extension)
+
+
+def thumbnail_name(digest: str, width: int, extension: str) -> str:
+    return '{}/{}/{}-{}w.{}'.format(THUMBNAIL_DIR, digest[:2], digest, width, extension)
+
+def make_thumbnails(data: bytes) -> Thumbnails:
+    """Resize an image, thumbnails that already exist are not made again."""
+    digest = hashlib.sha256(data).hexdigest()
+    image = ImageOps.exif_transpose(Image.open(BytesIO(data)))
+    has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+    extension = 'png' if has_alpha else 'jpg'
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    widths = tuple( width for width in THUMBNAIL_WIDTHS if width < image.width )
+    if not widths:
+        widths = (image.width,)
+    for width in widths:
+        resized = None
+        for ext in (extension, 'webp'):
+            name = thumbnail_name(digest, width, ext)
+            if default_storage.exists(name):
+                continue
+            if resized is None:
+                height = max(1, round(image.height * width / image.width))
+                resized = image.resize((width, height), Image.LANCZOS)
+            pil_format, options = _FORMATS[ext]
+            output = BytesIO()
+            resized.save(output, pil_format, **options)
+            default_storage.save(name, ContentFile(output.getvalue()))
+    return Thumbnails(digest, widths, extension)
+
+def update_course_thumbnails(pk: int) -> Thumbnails:
+    """Make the thumbnails for a course's image and store them on the course.
+
+    Returns None if there is no image, or if it cannot be resized.
+    """
+    from courses.models import Course
+    from courses.pagecache import forget_pages
+    from courses.routing import forget_routes
+
+    course = Course.objects.filter(pk=pk).only('image_path').first()
+    if course is None or not course.image_path:
+        return None
+    try:
+        with course.image_path.open('rb') as image_file:
+            thumbnails = make_thumbnails(image_file.read())
+    except Exception:
+        # Pillow and the storage raise many kinds of errors for a broken image.
+        logger.exception('Cannot make the thumbnails of course %s from %s',
+            pk, course.image_path.name)
+        Course.objects.filter(pk=pk, image_path=course.image_path.name).update(
+            image_thumbnails=THUMBNAILS_FAILED,
+        )
+        return None
+    # update() so that the course's other fields are not touched, the image
+    # may have been replaced in the meantime. last_modified changes the
+    # version of the content for the other processes, see courses.versions.
+    Course.objects.filter(pk=pk, image_path=course.image_path.name).update(
+        image_thumbnails=thumbnails.to_json(),
+        last_modified=timezone.now(),
+    )
+    forget_routes()
+    forget_pages()
+    return thumbnails
+
+def _update_course_thumbnails_thread(pk: int) -> None:
+    try:
+        update_course_thumbnails(pk)
+    except Exception:
+        logger.exception('Cannot update the thumbnails of course %s', pk)
+    finally:
+        connection.close()
+
+def make_course_thumbnails_later(pk: int) -> None:
+    """Make the thumbnails in a background thread once the course is saved."""
+    transaction.on_commit(lambda: threading.Thread(
+        target=_update_course_thumbnails_thread,
+        args=(pk,),
+        daemon=True,
+    ).start())
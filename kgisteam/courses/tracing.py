@@ -0,0 +1,171 @@
+"""Where a request spends its time, for a sample of the requests.
+
+TracingMiddleware picks COURSES_TRACE_SAMPLE_RATE of the requests (a float
+between 0 and 1, see the settings). For those it adds up the time spent in
+
+    sql       every query, with the number of queries
+    session   the queries on the session table, i.e. loading and saving
+    template  rendering a template, which includes the markdown below
+    markdown  courses.rendering.render_markdown
+    eval      evaluating answer expressions, see courses.maths
+
+and sends it in a Server-Timing header, which the network panel of the
+browser shows. If COURSES_TRACE_LOG is set, a JSON record is also appended
+to that file for every sampled request, one per line. Requests that are not
+sampled only cost a random number, the timed blocks check for a trace and do
+nothing else (except for eval, which is also a metric, see courses.metrics).
+"""
+from contextvars import ContextVar
+from contextlib import ExitStack
+import json
+import logging
+import os
+import random
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+_trace = ContextVar('courses_trace', default=None)
+
+
+class Trace:
+    """{ span_name: [milliseconds, count] } for one request."""
+
+    def __init__(self):
+        self.spans = dict()
+
+    def add(self, name: str, ms: float) -> None:
+        span = self.spans.setdefault(name, [0.0, 0])
+        span[0] += ms
+        span[1] += 1
+
+    def server_timing(self, total_ms: float) -> str:
+        entries = [ '{};dur={:.1f};desc="{}x"'.format(name, ms, count)
+            for name, (ms, count) in self.spans.items() ]
+        entries.append('total;dur={:.1f}'.format(total_ms))
+        return ', '.join(entries)
+
+
+class timed:
+    """with timed('name'): adds the time of the block to the current trace.
+
+    The time is also observed in histogram (see courses.metrics) if given,
+    for every request.
+    """
+    __slots__ = ('name', 'histogram', 'trace', 'start')
+
+    def __init__(self, name: str, histogram=None):
+        self.name = name
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.trace = _trace.get()
+        if self.trace is not None or self.histogram is not None:
+            self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if self.trace is not None or self.histogram is not None:
+            seconds = time.perf_counter() - self.start
+            if self.trace is not None:
+                self.trace.add(self.name, seconds * 1000)
+            if self.histogram is not None:
+                self.histogram.observe(seconds)
+
+
+def _time_query(execute, sql, params, many, context):
+    """A database execute wrapper, see connection.execute_wrapper."""
+    trace = _trace.get()
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        ms = (time.perf_counter() - start) * 1000
+        trace.add('sql', ms)
+        if 'django_session' in sql:
+            trace.add('session', ms)
+
+def write_record(path: str, record: dict) -> None:
+    """Append record to the JSONL file at path.
+
+    The line is written with a single write to a file opened for appending,
+    so the records of several processes do not interleave. A file that
+    cannot be written is logged, the request goes on.
+    """
+    line = json.dumps(record, default=str) + '\n'
+    try:
+        with open(path, 'a') as f:
+            f.write(line)
+    except OSError as error:
+        logger.warning('Cannot write the trace log %s: %s', path, error)
+
+
+class TracingMiddleware:
+    """Trace a sample of the requests, this should be the first middleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = getattr(settings, 'COURSES_TRACE_SAMPLE_RATE', 0)
+        if not rate or random.random() >= rate:
+            return self.get_response(request)
+        trace = Trace()
+        token = _trace.set(trace)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(_time_query))
+                response = self.get_response(request)
+        finally:
+            _trace.reset(token)
+        total_ms = (time.perf_counter() - start) * 1000
+        response['Server-Timing'] = trace.server_timing(total_ms)
+        path = getattr(settings, 'COURSES_TRACE_LOG', None)
+        if path:
+            match = getattr(request, 'resolver_match', None)
+            write_record(path, {
+                'time': timezone.now().isoformat(),
+                'pid': os.getpid(),
+                'method': request.method,
+                'path': request.path,
+                'url_name': match.view_name if match else None,
+                'status': response.status_code,
+                'total_ms': round(total_ms, 3),
+                'spans': { name: {'ms': round(ms, 3), 'count': count}
+                    for name, (ms, count) in trace.spans.items() },
+            })
+        return response
+
+
+class TracedTemplate:
+    """A template of the django backend that times its rendering."""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        with timed('template'):
+            return self.template.render(context, request)
+
+
+class TracedDjangoTemplates(DjangoTemplates):
+    """The django template backend, with TracedTemplate templates.
+
+    Only the templates loaded through the backend are timed, so a template
+    and the templates it includes or extends are a single span.
+    """
+
+    def from_string(self, template_code):
+        return TracedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TracedTemplate(super().get_template(template_name))
@@ -24,6 +24,10 @@ urlpatterns = [
         views.worksheets_check_answer,
         name='worksheets-check',
     ),
+    path('worksheets/<int:worksheet_id>/problems/check',
+        views.worksheets_check_answers,
+        name='worksheets-check-all',
+    ),
     path('{}/worksheets/<title>/<order>/randomize'.format(courses_base_url),
         views.worksheets_randomize,
         name='worksheets-randomize',
@@ -0,0 +1,94 @@
+"""Parse Problem.variables_with_values into a structured spec.
+
+'x[40, 0, 100, 1], y[2]' becomes a VariablesSpec with one Variable per name.
+Problem stores the spec as compact JSON when it is saved, so the string only
+has to be tokenized once instead of on every property access.
+"""
+from collections import namedtuple
+from functools import lru_cache
+import json
+
+
+class Variable(namedtuple('Variable', ['name', 'default', 'min', 'max', 'is_int', 'arity'])):
+    """A single variable, arity is the number of values that were given."""
+    __slots__ = ()
+
+    def as_list(self) -> list:
+        """The values as they were written: [default_value, min, max, is_int]"""
+        if self.arity == 4:
+            return [self.default, self.min, self.max, float(self.is_int)]
+        elif self.arity == 3:
+            return [self.default, self.min, self.max]
+        elif self.arity == 2:
+            return [self.default, self.max]
+        else:
+            return [self.default]
+
+
+class VariablesSpec(namedtuple('VariablesSpec', ['source', 'variables', 'is_randomizable'])):
+    """All the variables of a problem, and the text they were parsed from."""
+    __slots__ = ()
+
+    @property
+    def has_variables(self) -> bool:
+        return bool(self.variables)
+
+    @property
+    def names(self) -> list:
+        return [ variable.name for variable in self.variables ]
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                'source': self.source,
+                'variables': [ list(variable) for variable in self.variables ],
+                'is_randomizable': self.is_randomizable,
+            },
+            separators=(',', ':'),
+        )
+
+
+def _variable_from_values(name: str, values: list) -> Variable:
+    arity = len(values)
+    if arity == 4:
+        return Variable(name, values[0], values[1], values[2], bool(values[3]), arity)
+    elif arity == 3:
+        return Variable(name, values[0], values[1], values[2], False, arity)
+    elif arity == 2:
+        # variable[default_value, max], the default value is also the minimum.
+        return Variable(name, values[0], values[0], values[1], False, arity)
+    elif arity == 1:
+        return Variable(name, values[0], values[0], values[0], False, arity)
+    raise ValueError('Variable {} must have between 1 and 4 values.'.format(name))
+
+@lru_cache(maxsize=1024)
+def parse_variables(variables_with_values: str) -> VariablesSpec:
+    """Parse 'name[default_value, min, max, is_int], ...' into a VariablesSpec.
+
+    Raises ValueError if the string is malformed.
+    """
+    variables = list()
+    if variables_with_values:
+        for _ in [ var.strip() for var in variables_with_values.split('],') ]:
+            # Trim the brackets
+            variable_name, variable_values = _.split('[')
+            variable_values = variable_values.replace(']', '')
+            # Convert the numbers into a list.
+            values = [ float(value) for value in variable_values.split(', ') ]
+            variables.append(_variable_from_values(variable_name, values))
+    return VariablesSpec(
+        source=variables_with_values,
+        variables=tuple(variables),
+        is_randomizable=any(
+            variable.min != variable.max for variable in variables
+        ),
+    )
+
+def variables_spec_from_json(variables_spec: str) -> VariablesSpec:
+    """Load a VariablesSpec that was stored with VariablesSpec.to_json."""
+    data = json.loads(variables_spec)
+    return VariablesSpec(
+        source=data['source'],
+        variables=tuple( Variable(*variable) for variable in data['variables'] ),
+        is_randomizable=data['is_randomizable'],
+    )
@@ -0,0 +1,95 @@
+"""The version of the course content, read from the database.
+
+Data that is derived from the database and kept outside of it (the routing
+index, cached pages, ETags) is stored with the version of the rows it was
+made from, and is made again when the version changes. The version is read
+with a single query: the latest last_modified and the number of rows of
+every model in CONTENT_MODELS, and the largest id and the number of rows of
+the many to many tables, whose rows are only ever inserted and deleted. Any
+committed change, made by any process, changes the version.
+
+The version is read once per request and remembered until the next request
+starts, or until this process changes one of the models (see forget_version
+and CoursesConfig.ready). Data made from some of the models, like the
+routing index, asks for the version of just those, so it is not made again
+when the others change. last_modified is indexed, so the maximums are read
+from the indexes.
+"""
+from collections import namedtuple
+import hashlib
+import threading
+
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from courses.models import Course, Lesson, Resource, Syllabus, Worksheet
+
+
+# Everything the routing index and the cached pages are made from.
+CONTENT_MODELS = (
+    Course,
+    Syllabus,
+    Lesson,
+    Resource,
+    Worksheet,
+    Resource.courses.through,
+    Worksheet.course.through,
+)
+
+Version = namedtuple('Version', ['token', 'last_modified'])
+
+_local = threading.local()
+
+
+def _as_datetime(value) -> 'datetime':
+    """A value of MAX(last_modified), which is a string on SQLite."""
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    if value is not None and timezone.is_naive(value):
+        value = timezone.make_aware(value, timezone.utc)
+    return value
+
+def _has_last_modified(model) -> bool:
+    return any( field.attname == 'last_modified' for field in model._meta.concrete_fields )
+
+def _read_values() -> dict:
+    """{ model: (latest last_modified or largest id, number of rows) }"""
+    quote = connection.ops.quote_name
+    columns = list()
+    for model in CONTENT_MODELS:
+        table = quote(model._meta.db_table)
+        if _has_last_modified(model):
+            column = quote('last_modified')
+        else:
+            column = quote(model._meta.pk.column)
+        columns.append('(SELECT MAX({}) FROM {})'.format(column, table))
+        columns.append('(SELECT COUNT(*) FROM {})'.format(table))
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT {}'.format(', '.join(columns)))
+        row = cursor.fetchone()
+    return { model: (row[2 * i], row[2 * i + 1]) for i, model in enumerate(CONTENT_MODELS) }
+
+def content_version(models: tuple = CONTENT_MODELS) -> Version:
+    """The current version of some of CONTENT_MODELS, read at most once per request.
+
+    The values of all the models are read together, so asking for the
+    versions of different models costs a single query.
+    """
+    values = getattr(_local, 'values', None)
+    if values is None:
+        values = _local.values = _read_values()
+    last_modified = [ _as_datetime(values[model][0]) for model in models
+        if _has_last_modified(model) and values[model][0] is not None ]
+    return Version(
+        token=hashlib.sha1(repr([ str(value) for model in models
+            for value in values[model] ]).encode()).hexdigest(),
+        last_modified=max(last_modified) if last_modified else None,
+    )
+
+def forget_version(*args, **kwargs) -> None:
+    """Read the version again the next time it is needed.
+
+    The arguments are ignored so that this can be used as a signal receiver.
+    """
+    _local.values = None
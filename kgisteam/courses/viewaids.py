@@ -1,46 +1,72 @@
 from collections import namedtuple
 from copy import deepcopy
+import hashlib
+import random
 
 from django.core.paginator import Paginator
+from django.db import transaction
 from django.utils.functional import cached_property
 
-from courses.models import Course
+from courses.models import Worksheet, WorksheetProgress
+from courses.routing import course_worksheets, find_course
 
 
 def course_from_kwargs(kwargs: dict) -> "<class 'courses.models.Course'>":
-    """Course object from the url.
+    """Course object from the url, or None.
 
     In the data base the 'nen (year)' and 'kumi (class number/letter)'
     are stored in separate fields. In the urls, however, they have been combined
-    for readability into the string 'nen-kumi'.
+    for readability into the string 'nen-kumi', which is also stored in
+    Course.nen_kumi. The course is found in courses.routing, not queried.
     """
-    # Split nen-kumi into nen and kumi
-    nen_kumi = kwargs['nen_kumi']
-    # Remove anything in kwargs that does not correspond to a field in Course.
-    filtered_kwargs = {
-        key: value for key, value in kwargs.items()
-        if key in (field.name for field in Course._meta.fields)
-    }
-    filtered_kwargs['nen'], filtered_kwargs['kumi'] = nen_kumi[0], nen_kumi[2]
-    return Course.objects.filter(**filtered_kwargs).first()
+    return find_course(
+        kwargs['year'], kwargs['school'], kwargs['name'], kwargs['nen_kumi']
+    )
+
+def drop_legacy_session_keys(session: 'SessionStore') -> None:
+    """Remove data stored in the session by older versions of the site."""
+    for key in (
+            'active_problem_pks',
+            'checked_problems_correct',
+            'checked_problems_incorrect',
+            'randomized_course_ws_pks',
+            'randomized_problems'):
+        session.pop(key, None)
 
-def get_checked_problems(result: str, session: 'SessionStore') -> tuple:
-    """Get the primary keys of attempted problems from the session.
+def get_checked_problems(session: 'SessionStore', worksheet_id: int) -> namedtuple:
+    """Get the primary keys of attempted problems in a worksheet.
 
-    When this is called with result=both the return value will be a namedtuple
-    where the first element (index 0) is the incorrectly answered problems and
-    the second element (index 1) is the correctly answered problems.
+    The return value is a namedtuple where the first element (index 0) is the
+    incorrectly answered problems and the second element (index 1) is the
+    correctly answered problems.
     """
-    if result == 'correct' or result == 'incorrect':
-        checked_problems = session.get('checked_problems_{}'.format(result)) or tuple()
-        return checked_problems
-    elif result == 'both':
-        CheckedProblems = namedtuple('CheckedProblems', ['incorrect', 'correct'])
-        checked_problems = CheckedProblems(
-            session.get('checked_problems_incorrect', default=tuple()),
-            session.get('checked_problems_correct', default=tuple()),
-        )
-        return checked_problems
+    CheckedProblems = namedtuple('CheckedProblems', ['incorrect', 'correct'])
+    progress = None
+    if session.session_key and worksheet_id:
+        progress = WorksheetProgress.objects.filter(
+            session_key=session.session_key,
+            worksheet_id=worksheet_id,
+        ).first()
+    if progress:
+        return CheckedProblems(progress.incorrect_pks, progress.correct_pks)
+    else:
+        return CheckedProblems(list(), list())
+
+def get_randomization_seed(session: 'SessionStore', worksheet_id: int) -> int:
+    """The seed for the randomized variables in a worksheet, or None."""
+    return (session.get('randomized_worksheets') or dict()).get(str(worksheet_id))
+
+def get_shuffle_seed(session: 'SessionStore', worksheet_id: int) -> int:
+    """The seed for the order of the shuffled problems in a worksheet.
+
+    A seed is made the first time a worksheet is shuffled, so the order stays
+    the same across reloads until the worksheet is reset.
+    """
+    shuffled_worksheets = session.get('shuffled_worksheets') or dict()
+    if str(worksheet_id) not in shuffled_worksheets:
+        shuffled_worksheets[str(worksheet_id)] = random.getrandbits(31)
+        session['shuffled_worksheets'] = shuffled_worksheets
+    return shuffled_worksheets[str(worksheet_id)]
 
 def kwargs_from_course(course: "<class 'courses.models.Course'>") -> dict:
     return {
@@ -57,32 +83,45 @@ def kwargs_from_course_and_worksheet(course, worksheet) -> dict:
         'order': 'ordered',
     }
 
-def terminate(syllabus: 'Syllabus') -> list:
-    """ Split lessons into their terms."""
-    lessons = syllabus.lesson_set.all()
-    return [[ lesson for lesson in lessons if lesson.term_num == i ] for i in range(1, 5)]
-
-def updated_checked_problems(response: dict, session: 'SessionStore') -> namedtuple:
-    checked_incorrect, checked_correct = get_checked_problems('both', session)
-    checked_incorrect, checked_correct = set(checked_incorrect), set(checked_correct)
-    result = response['result']
-    pk = response['primary-key']
-    if result == 'incorrect':
-        checked_incorrect.add(pk)
-        if pk in checked_correct: checked_correct.remove(pk)
-    elif result == 'correct':
-        checked_correct.add(pk)
-        if pk in checked_incorrect: checked_incorrect.remove(pk)
-    CheckedProblems = namedtuple('CheckedProblems', ['incorrect', 'correct'])
-    checked_problems = CheckedProblems(
-        tuple(checked_incorrect),
-        tuple(checked_correct),
-    )
-    return checked_problems
+def shuffle_problems(problems: list, seed: int) -> list:
+    """The problems in the order given by seed.
+
+    Each problem is sorted by a hash of the seed and its pk, so adding or
+    removing a problem does not move the others.
+    """
+    def position(problem):
+        return hashlib.sha256('{}-{}'.format(seed, problem.pk).encode()).digest()
+    return sorted(problems, key=position)
+
+def save_checked_problems(responses: list, session: 'SessionStore', worksheet_id: int) -> None:
+    """Update the worksheet progress with the results of checked problems.
+
+    This is a single row upsert, the session itself is not modified. An empty
+    session is saved first if necessary, so that it has a session key.
+    """
+    if not worksheet_id:
+        return
+    if session.session_key is None:
+        session.save()
+    with transaction.atomic():
+        progress, created = WorksheetProgress.objects.select_for_update().get_or_create(
+            session_key=session.session_key,
+            worksheet_id=worksheet_id,
+        )
+        progress.update_checked(responses)
+        progress.save()
+
+def worksheet_from_kwargs(kwargs: dict, course=None) -> "<class 'courses.modes.Worksheet'>":
+    """Worksheet object from the url.
 
-def worksheet_from_kwargs(kwargs: dict) -> "<class 'courses.modes.Worksheet'>":
-    course = course_from_kwargs(kwargs)
+    Pass the course if it has already been looked up. The worksheet is found
+    in courses.routing, not queried.
+    """
     if kwargs['title'] == 'None':
         return None
-    else:
-        return course.worksheet_set.get(title=kwargs['title'])
+    if course is None:
+        course = course_from_kwargs(kwargs)
+    for worksheet in course_worksheets(course):
+        if worksheet.title == kwargs['title']:
+            return worksheet
+    raise Worksheet.DoesNotExist('No worksheet titled {!r} in {}.'.format(kwargs['title'], course))
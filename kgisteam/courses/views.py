@@ -1,16 +1,41 @@
 from math import trunc
+import hmac
+import json
+import random
 
-from django.http import JsonResponse
-from django.shortcuts import redirect, render
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.conf import settings
+from django.http import ( FileResponse, Http404, HttpResponse,
+    HttpResponseForbidden, JsonResponse )
+from django.shortcuts import get_object_or_404, redirect, render
 from django.views.decorators.http import require_POST
 
+from courses.answerkeys import ANSWER_KEY_FIELDS
+from courses.conditional import ( conditional_page, resources_validator,
+    syllabus_validator, worksheets_validator )
 from courses.forms import WorksheetProblemForm
-from courses.maths import sn_round
-from courses.models import Course, Resource, Problem, Syllabus, Worksheet
+from courses.models import ( Course, Resource, Problem, Syllabus, Worksheet,
+    WorksheetProgress )
+from courses.metrics import ANSWER_CHECKS, render_metrics
+from courses.pagecache import cache_public_page
+from courses.profiling import CAPTURE_NAME, capture_path, list_captures
+from courses.routing import course_worksheets
 from courses.viewaids import ( course_from_kwargs, worksheet_from_kwargs,
-    get_checked_problems, terminate, updated_checked_problems )
+    drop_legacy_session_keys, get_checked_problems, get_randomization_seed,
+    get_shuffle_seed, save_checked_problems, shuffle_problems )
 
+# The most answers worksheets_check_answers accepts in one request.
+MAX_CHECKED_ANSWERS = 200
+# The label of each result in the courses_answer_checks_total metric.
+CHECK_RESULT_LABELS = {
+    'correct': 'correct',
+    'incorrect': 'incorrect',
+    'invalid form': 'invalid',
+}
 
+
+@cache_public_page
 def home(request):
     context = {
         'courses': Course.objects.order_by('-school', 'nen', 'kumi'),
@@ -19,15 +44,19 @@ def home(request):
     return render(request, 'courses/home.html', context)
 
 
+@conditional_page(syllabus_validator)
+@cache_public_page
 def syllabus(request, *args, **kwargs):
     course = course_from_kwargs(kwargs)
     syllabus = Syllabus.objects.filter(course=course).first()
-    if syllabus and course.term_now: 
-        lessons = terminate(syllabus)
+    term_now = course.term_now
+    if syllabus:
+        syllabus.course = course
+    if syllabus and term_now:
         if 1 <= kwargs['term'] <= 4:
-            lessons = lessons[kwargs['term'] - 1]
+            lessons = syllabus.lessons_in_term(kwargs['term'])
         else:
-            lessons = lessons[course.term_now - 1]
+            lessons = syllabus.lessons_in_term(term_now)
     elif syllabus:
         lessons = syllabus.lesson_set.all()
     else:
@@ -42,26 +71,39 @@ def syllabus(request, *args, **kwargs):
 
 
 # Begin worksheet view functions----------------------------------------------->
+@conditional_page(worksheets_validator)
 def worksheets(request, *args, **kwargs):
+    """A course's worksheets, and the problems in the active worksheet.
+
+    The page is built from a fixed number of queries however many problems
+    the worksheet has: the course and the worksheets for the menu come from
+    courses.routing, and the problems are fetched once, sharing the active
+    worksheet instance.
+    """
     course = course_from_kwargs(kwargs)
-    active_worksheet = worksheet_from_kwargs(kwargs)
+    worksheets = course_worksheets(course)
+    active_worksheet = worksheet_from_kwargs(kwargs, course)
     context = {
         'course': course,
+        'worksheets': worksheets,
     }
+    drop_legacy_session_keys(request.session)
     if active_worksheet:
         # get problems and update context
-        active_problems = active_worksheet.problem_set.all()
-        active_problem_pks = [ problem.pk for problem in active_problems ]
-        randomized_problems = request.session.get('randomized_problems')
-        context['is_randomized'] = 0
-        if randomized_problems:
-            for problem in active_problems:
-                if str(problem.pk) in randomized_problems.keys():
-                    problem.use_variables(randomized_problems[str(problem.pk)])
-                    context['is_randomized'] = 1
+        active_problems = list(active_worksheet.problem_set.all())
         if kwargs['order'] == 'random':
-            active_problems = active_problems.order_by('?')
-        request.session['active_problem_pks'] = active_problem_pks
+            active_problems = shuffle_problems(
+                active_problems,
+                get_shuffle_seed(request.session, active_worksheet.pk),
+            )
+        seed = get_randomization_seed(request.session, active_worksheet.pk)
+        context['is_randomized'] = 0
+        for problem in active_problems:
+            problem.worksheet = active_worksheet
+            if seed is not None and problem.variables.has_variables:
+                problem.use_variables(problem.variables_randomized(seed))
+        if seed is not None:
+            context['is_randomized'] = 1
         context['active_worksheet'] = active_worksheet
         context['active_problems'] = active_problems
         context['worksheet_problem_form'] = WorksheetProblemForm()
@@ -71,24 +113,21 @@ def worksheets(request, *args, **kwargs):
 
 @require_POST
 def worksheets_check_answer(request, *args, **kwargs) -> 'JsonResponse':
-    """Update the session with user progress.
-
-    Session keys
-        checked_problems_incorrect: session key
-            the primary keys of incorrectly answered problems.
-        checked_problems_correct: session key
-            the primary keys of correctly answered problems.
+    """Check an answer and update the user's progress.
 
-        Motivation
-        The session dictionary should not be deep (`djdocs-when-sessions-are-saved`_).
+    Progress is stored per session and worksheet in WorksheetProgress rather
+    than in the session, so the session does not grow with every worksheet
+    (`djdocs-when-sessions-are-saved`_).
 
     .. _djdocs-when-session-are-saved: https://docs.djangoproject.com/en/2.2/topics/http/sessions/#when-sessions-are-saved
     """
-    problem = Problem.objects.filter(pk=kwargs['problem_id']).first()
-    randomized_problems = request.session.get('randomized_problems')
-    if randomized_problems:
-        if str(problem.pk) in randomized_problems.keys():
-            problem.use_variables(randomized_problems[str(problem.pk)])
+    problem = get_object_or_404(
+        Problem.objects.only(*ANSWER_KEY_FIELDS),
+        pk=kwargs['problem_id'],
+    )
+    seed = get_randomization_seed(request.session, problem.worksheet_id)
+    if seed is not None and problem.variables.has_variables:
+        problem.use_variables(problem.variables_randomized(seed))
     # Default response
     json_response = {
         'primary-key': problem.pk,
@@ -103,78 +142,162 @@ def worksheets_check_answer(request, *args, **kwargs) -> 'JsonResponse':
             json_response['result'] = 'correct'
         else:
             json_response['result'] = 'incorrect'
-        # Update session
-        request.session['checked_problems_incorrect'] = updated_checked_problems(json_response, request.session)[0]
-        request.session['checked_problems_correct'] = updated_checked_problems(json_response, request.session)[1]
+        # Update progress
+        save_checked_problems([json_response], request.session, problem.worksheet_id)
+    ANSWER_CHECKS.inc(result=CHECK_RESULT_LABELS[json_response['result']])
     return JsonResponse(json_response)
 
 
+@require_POST
+def worksheets_check_answers(request, *args, **kwargs) -> 'JsonResponse':
+    """Check the answers to several problems in a worksheet at once.
+
+    The request body is a JSON array of [problem_id, user_answer] pairs. The
+    problems are fetched with one query and the progress is written once.
+    The response contains a list with one result per problem, in the same
+    format as worksheets_check_answer.
+    """
+    try:
+        answers = [ (int(pk), str(user_answer))
+            for pk, user_answer in json.loads(request.body) ]
+    except (TypeError, ValueError, OverflowError):
+        return JsonResponse({'results': [], 'error': 'invalid request'}, status=400)
+    if len(answers) > MAX_CHECKED_ANSWERS:
+        return JsonResponse({'results': [], 'error': 'too many answers'}, status=400)
+    worksheet = get_object_or_404(Worksheet.objects.only('pk'), pk=kwargs['worksheet_id'])
+    problems = Problem.objects.only(*ANSWER_KEY_FIELDS).filter(
+        worksheet_id=worksheet.pk,
+        pk__in=[ pk for pk, user_answer in answers ],
+    ).in_bulk()
+    seed = get_randomization_seed(request.session, worksheet.pk)
+    results = list()
+    for pk, user_answer in answers:
+        problem = problems.get(pk)
+        if problem is None:
+            continue
+        if seed is not None and problem.variables.has_variables:
+            problem.use_variables(problem.variables_randomized(seed))
+        json_response = {
+            'primary-key': problem.pk,
+            'HTML_id': problem.html_id,
+            'result': 'invalid form',
+        }
+        form = WorksheetProblemForm({'user_answer': user_answer})
+        if form.is_valid():
+            if problem.check_user_answer(form.cleaned_data['user_answer']):
+                json_response['result'] = 'correct'
+            else:
+                json_response['result'] = 'incorrect'
+        ANSWER_CHECKS.inc(result=CHECK_RESULT_LABELS[json_response['result']])
+        results.append(json_response)
+    if results:
+        save_checked_problems(results, request.session, worksheet.pk)
+    return JsonResponse({'results': results})
+
+
 def worksheets_check_answer_results(request, *args, **kwargs) -> 'JsonResponse':
+    """The checked problems in the worksheet given by ?worksheet=<pk>"""
+    try:
+        worksheet_id = int(request.GET.get('worksheet', 0))
+    except ValueError:
+        worksheet_id = 0
+    checked_problems = get_checked_problems(request.session, worksheet_id)
     json_response = {
-        'checked_problems_correct': get_checked_problems('correct', session=request.session),
-        'checked_problems_incorrect': get_checked_problems('incorrect', session=request.session),
+        'checked_problems_correct': checked_problems.correct,
+        'checked_problems_incorrect': checked_problems.incorrect,
     }
     return JsonResponse(json_response)
 
 
 def worksheets_randomize(request, *args, **kwargs):
-    course = course_from_kwargs(kwargs)
+    """Toggle the randomization of the variables in a worksheet.
+
+    Only a seed is stored in the session for each randomized worksheet, the
+    values are regenerated from it by Problem.variables_randomized.
+    """
     worksheet = worksheet_from_kwargs(kwargs)
-    course_ws_pk = '{}-{}'.format(course.pk, worksheet.pk)
-    problems = worksheet_from_kwargs(kwargs).problem_set.all()
-    randomized_course_ws_pks = request.session.get('randomized_course_ws_pks') or list()
-    if course_ws_pk in randomized_course_ws_pks:
-        # Remove the problems in the worksheet from randomized_problems
-        randomized_problems = request.session.get('randomized_problems')
-        for key in ( str(problem.pk) for problem in problems):
-            randomized_problems.pop(key, None)
-        request.session['randomized_problems'] = randomized_problems
-        try:
-            request.session['randomized_course_ws_pks'].remove(course_ws_pk)
-        except ValueError:
-            pass
+    randomized_worksheets = request.session.get('randomized_worksheets') or dict()
+    if str(worksheet.pk) in randomized_worksheets:
+        del randomized_worksheets[str(worksheet.pk)]
     else:
-        # Calculate random values for variables in problems.
-        problem_vars_values = { 
-            str(problem.pk): problem.variables_randomized()
-            for problem in problems
-            if problem.variables_as_lists
-        }
-        # update the session
-        randomized_problems = request.session.get('randomized_problems') or dict()
-        for problem_pk, variables_randomized in problem_vars_values.items():
-            randomized_problems[problem_pk] = variables_randomized
-        request.session['randomized_problems'] = randomized_problems
-        randomized_course_ws_pks.append(course_ws_pk)
-        request.session['randomized_course_ws_pks'] = randomized_course_ws_pks
+        randomized_worksheets[str(worksheet.pk)] = random.getrandbits(31)
+    request.session['randomized_worksheets'] = randomized_worksheets
     return redirect('courses:worksheets-reset', *args, **kwargs)
 
 
 def worksheets_reset(request, *args, **kwargs):
-    checked_problems = get_checked_problems('both', request.session)
-    if any(map(len, checked_problems)):
-        problem_pks = request.session['active_problem_pks']
-        for pk in problem_pks:
-            if pk in checked_problems[0]: checked_problems[0].remove(pk)
-            if pk in checked_problems[1]: checked_problems[1].remove(pk)
-        request.session['checked_problems_wrong'] = checked_problems[0]
-        request.session['checked_problems_right'] = checked_problems[1]
+    worksheet = worksheet_from_kwargs(kwargs)
+    shuffled_worksheets = request.session.get('shuffled_worksheets')
+    if worksheet and shuffled_worksheets and str(worksheet.pk) in shuffled_worksheets:
+        # The next shuffle gets a new order.
+        del shuffled_worksheets[str(worksheet.pk)]
+        request.session['shuffled_worksheets'] = shuffled_worksheets
+    if worksheet and request.session.session_key:
+        WorksheetProgress.objects.filter(
+            session_key=request.session.session_key,
+            worksheet=worksheet,
+        ).delete()
     return redirect('courses:worksheets', *args, **kwargs)
 
 
 def worksheets_reset_all(request, *args, **kwargs):
-    if request.session.get('checked_problems_correct'):
-        del request.session['checked_problems_correct']
-    if request.session.get('checked_problems_incorrect'):
-        del request.session['checked_problems_incorrect']
+    drop_legacy_session_keys(request.session)
+    request.session.pop('shuffled_worksheets', None)
+    if request.session.session_key:
+        WorksheetProgress.objects.filter(
+            session_key=request.session.session_key,
+        ).delete()
     return redirect('courses:worksheets', *args, **kwargs)
 # END worksheet view functions ------------------------------------------------>
 
 
+@conditional_page(resources_validator)
+@cache_public_page
 def resources(request, *args, **kwargs):
-    course = course = course_from_kwargs(kwargs)
+    course = course_from_kwargs(kwargs)
     context = {
         'course': course,
         'resources': course.resources,
     }
     return render(request, 'courses/resources.html', context)
+
+
+# BEGIN admin view functions -------------------------------------------------->
+@staff_member_required
+def admin_profiles(request):
+    """The captures of courses.profiling, newest first."""
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Request profiles',
+        'captures': list_captures(),
+    }
+    return render(request, 'courses/admin_profiles.html', context)
+
+
+@staff_member_required
+def admin_profile_file(request, name, extension):
+    """The .prof (a download) or .txt file of a capture."""
+    if not CAPTURE_NAME.match(name) or extension not in ('prof', 'txt'):
+        raise Http404
+    try:
+        f = open(capture_path(name, extension), 'rb')
+    except FileNotFoundError:
+        raise Http404
+    if extension == 'prof':
+        return FileResponse(f, as_attachment=True, filename='{}.prof'.format(name))
+    return FileResponse(f, content_type='text/plain; charset=utf-8')
+
+
+def metrics(request):
+    """The metrics of courses.metrics, in the Prometheus text format.
+
+    For staff, or with the header Authorization: Bearer <COURSES_METRICS_TOKEN>
+    for the Prometheus server.
+    """
+    token = getattr(settings, 'COURSES_METRICS_TOKEN', None)
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if not (request.user.is_staff or (token and
+            hmac.compare_digest(authorization.encode(), 'Bearer {}'.format(token).encode()))):
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+# END admin view functions ---------------------------------------------------->
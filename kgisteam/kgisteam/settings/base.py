@@ -94,6 +94,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so that the traces include the other middleware.
+    'courses.tracing.TracingMiddleware',
+    'courses.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -106,6 +109,8 @@ MIDDLEWARE = [
     'htmlmin.middleware.MarkRequestMiddleware',
     # END django-htmlmin middleware
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Needs request.user, see courses/profiling.py
+    'courses.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -120,7 +125,8 @@ IGNORABLE_404_URLS = [
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that times the rendering, see courses/tracing.py
+        'BACKEND': 'courses.tracing.TracedDjangoTemplates',
         # https://docs.djangoproject.com/en/2.2/howto/overriding-templates/
         'DIRS': [
             os.path.join(BASE_DIR, 'kgisteam/templates'),
@@ -165,6 +171,34 @@ else:
             }
         }
 
+# Caches
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Rendered problem HTML, see courses/rendering.py
+    'markdown': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'markdown',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+    # Public course pages, see courses/pagecache.py. A FileBasedCache shares
+    # the pages between processes.
+    'pages': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pages',
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -213,6 +247,26 @@ STATIC_URL = '/static/'
 # Adding settings to the default: Settings are in alphabetical order.
 AUTH_USER_MODEL = 'users.CustomUser'
 
+# The results of manage.py benchmark_routes, see its --output
+COURSES_BENCHMARK_DIR = os.getenv('COURSES_BENCHMARK_DIR', os.path.join(BASE_DIR, 'benchmarks'))
+
+# Metrics for Prometheus, see courses/metrics.py. Set the directory in the
+# environment of the server only, e.g. /run/kgisteam/metrics, shared by the
+# worker processes of this host and by no other host. Without it each worker
+# only reports itself. Left over files are deleted after the retention in
+# seconds. The token is sent by the Prometheus server.
+COURSES_METRICS_DIR = os.getenv('COURSES_METRICS_DIR')
+COURSES_METRICS_RETENTION = int(os.getenv('COURSES_METRICS_RETENTION', 24 * 60 * 60))
+COURSES_METRICS_TOKEN = os.getenv('COURSES_METRICS_TOKEN')
+
+# Profiles of single requests for staff, see courses/profiling.py
+COURSES_PROFILE_DIR = os.getenv('COURSES_PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
+COURSES_PROFILE_KEEP = int(os.getenv('COURSES_PROFILE_KEEP', 50))
+
+# Request tracing, see courses/tracing.py. The sample rate is between 0 and 1.
+COURSES_TRACE_SAMPLE_RATE = float(os.getenv('COURSES_TRACE_SAMPLE_RATE', 0))
+COURSES_TRACE_LOG = os.getenv('COURSES_TRACE_LOG')
+
 # django-taggit settings
 TAGGIT_CASE_INSENSITIVE = True
 
@@ -0,0 +1,34 @@
+/*
+*/
+export default ajaxJson;
+export { ajaxJson };
+
+
+import { getCookie } from "/static/kgisteam/js/getCookie.js";
+
+function ajaxJson(method, url, data, with_csrf, updateFunction) {
+    // Declare variables
+    let xhr;
+    let csrftoken;
+    // Create and send the request
+    xhr = new XMLHttpRequest();
+    xhr.open(method, url);
+    xhr.setRequestHeader("Content-Type", "application/json");
+    if (with_csrf) {
+        csrftoken = getCookie("csrftoken");
+        xhr.setRequestHeader("X-CSRFToken", csrftoken);
+    }
+    xhr.send(JSON.stringify(data));
+    // Recieve the response
+    xhr.onreadystatechange = function () {
+        let DONE = 4;  // readyState 4 means the request is done.
+        let OK = 200;  // status 200 is a successful return.
+        if (xhr.readyState === DONE) {
+            if (xhr.status === OK) {
+                updateFunction(xhr);
+            } else {
+                console.log("Error: " + xhr.status);
+            }
+        }
+    } // end of function
+} // end of function ajaxJson
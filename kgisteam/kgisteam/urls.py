@@ -17,12 +17,10 @@ from django.conf import settings
 from django.conf.urls import url
 from django.conf.urls.static import static
 from django.contrib import admin
-from django.contrib.sitemaps import GenericSitemap
-from django.contrib.sitemaps.views import sitemap
 from django.urls import include, path
 
 from courses import views as courses_views
-from courses.models import Syllabus
+from courses.sitemaps import sitemap, sitemap_section
 from kgisteam import views as kgisteam_views
 
 
@@ -31,25 +29,24 @@ admin.site.site_header = 'KGIsteam admin'
 admin.site.site_title = 'KGIsteam admin'
 admin.site.index_title = 'KGIsteam administration'
 
-info_dict = {
-    'queryset': Syllabus.objects.all(),
-    'date_field': 'last_modified',
-}
-
 urlpatterns = [
     path('', courses_views.home, name='home'),
+    # Before admin.site.urls, which would answer these with a 404.
+    path('admin/profiles/', courses_views.admin_profiles, name='admin-profiles'),
+    path('admin/profiles/<name>.<extension>', courses_views.admin_profile_file,
+        name='admin-profile-file',
+    ),
     path('admin/', admin.site.urls),
+    path('metrics', courses_views.metrics, name='metrics'),
     path('admin/doc/', include('django.contrib.admindocs.urls')),
     path('courses/', include('courses.urls')),
     url(r'^martor/', include('martor.urls')),
 
     # Sitemap https://docs.djangoproject.com/en/3.0/ref/contrib/sitemaps/
-    path('sitemap.xml', sitemap, {'sitemaps': {
-            'courses': GenericSitemap(info_dict, priority=0.5)
-            }
-        },
+    path('sitemap.xml', sitemap,
         name='django.contrib.sitemaps.views.sitemap'
     ),
+    path('sitemap-<section>.xml', sitemap_section, name='sitemap-section'),
 
     # URLs for testing
     path('test/error404', kgisteam_views.error_404, name='error404'),